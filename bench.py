@@ -0,0 +1,437 @@
+# bench.py
+# --------
+# Licensing Information:  You are free to use or extend these projects for
+# educational purposes provided that (1) you do not distribute or publish
+# solutions, (2) you retain this notice, and (3) you provide clear
+# attribution to UC Berkeley, including a link to http://ai.berkeley.edu.
+#
+# Attribution Information: The Pacman AI projects were developed at UC Berkeley.
+# The core projects and autograders were primarily created by John DeNero
+# (denero@cs.berkeley.edu) and Dan Klein (klein@cs.berkeley.edu).
+# Student side autograding was added by Brad Miller, Nick Hay, and
+# Pieter Abbeel (pabbeel@cs.berkeley.edu).
+
+
+"""
+Benchmarks for the search code and the game engine.  Run
+
+> python bench.py queue
+
+to compare the frontier of A* when it is an IndexedPriorityQueue (priority
+lowered in place) against a plain PriorityQueue that gets a duplicate entry
+pushed for every improved path, and
+
+> python bench.py successor
+
+to measure how many GameState.generateSuccessor calls per second random
+game tree walks manage on the classic layouts, and to check the incremental
+state hashes on more such walks, and
+
+> python bench.py search
+
+to run DFS, BFS, UCS and A* (once per heuristic) on every bundled maze,
+corners and food search layout, write the timings, expansions and peak
+memory to a JSON results file and compare them against the checked in
+baseline, benchBaseline.json.  It only records what does not depend on the
+machine (status, expansions and path cost), so timings are compared
+separately, against a local file recorded with --updateTimings.  Run
+python bench.py --help for the options.
+"""
+
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+import util
+import layout
+import pacman
+import search
+import searchAgents
+
+class CountingQueueMixin:
+    "Records pushes, pops and the largest heap size seen by a priority queue."
+    def resetCounts(self):
+        self.pushes, self.pops, self.maxSize = 0, 0, 0
+
+    def push(self, item, priority):
+        self.pushes += 1
+        super().push(item, priority)
+        if len(self.heap) > self.maxSize: self.maxSize = len(self.heap)
+
+    def pop(self):
+        self.pops += 1
+        return super().pop()
+
+class RepushQueue(CountingQueueMixin, util.PriorityQueue):
+    "A PriorityQueue whose update just pushes another entry for the item."
+    def __init__(self):
+        util.PriorityQueue.__init__(self)
+        self.resetCounts()
+
+    def update(self, item, priority):
+        self.push(item, priority)
+
+class CountingIndexedQueue(CountingQueueMixin, util.IndexedPriorityQueue):
+    def __init__(self):
+        util.IndexedPriorityQueue.__init__(self)
+        self.resetCounts()
+
+QUEUE_BENCHMARKS = [
+    ('bigMaze', 'PositionSearchProblem', 'manhattanHeuristic'),
+    ('mediumCorners', 'CornersProblem', 'cornersHeuristic'),
+    ('trickySearch', 'FoodSearchProblem', 'foodHeuristic'),
+]
+
+def makeProblem(layoutName, problemName):
+    "Builds a fresh search problem of the given type on a bundled layout."
+    gameState = pacman.GameState()
+    gameState.initialize(layout.getLayout(layoutName), 0)
+    problemType = getattr(searchAgents, problemName)
+    if problemType is searchAgents.PositionSearchProblem:
+        return problemType(gameState, warn=False, visualize=False)
+    return problemType(gameState)
+
+def queueBenchmark(options=None):
+    """
+    Runs A* on each of QUEUE_BENCHMARKS once per queue type and prints the
+    heap size and number of pops each needed.
+    """
+    print('%-14s %-10s %8s %8s %8s %8s %8s' %
+          ('layout', 'queue', 'pushes', 'pops', 'maxHeap', 'cost', 'seconds'))
+    for layoutName, problemName, heuristicName in QUEUE_BENCHMARKS:
+        heuristic = getattr(searchAgents, heuristicName)
+        results = {}
+        for label, queueType in [('repush', RepushQueue), ('indexed', CountingIndexedQueue)]:
+            problem = makeProblem(layoutName, problemName)
+            queue = queueType()
+            start = time.time()
+            path = search.bestFirstSearch(problem, heuristic, queue)
+            elapsed = time.time() - start
+            results[label] = queue
+            print('%-14s %-10s %8d %8d %8d %8d %8.2f' %
+                  (layoutName, label, queue.pushes, queue.pops,
+                   queue.maxSize, problem.getCostOfActions(path), elapsed))
+        old, new = results['repush'], results['indexed']
+        print('%-14s %-10s %8d %8d %8d' %
+              (layoutName, 'saved', old.pushes - new.pushes, old.pops - new.pops,
+               old.maxSize - new.maxSize))
+
+SUCCESSOR_LAYOUTS = ['mediumClassic', 'originalClassic']
+
+# Untimed walks per layout whose state hashes are checked against a full recompute
+HASH_CHECK_WALKS = 20
+
+def fullHash(state):
+    "The hash GameStateData.__hash__ should give state, recomputed from scratch"
+    return hash((state.data._zobristHash(), state.data.score))
+
+def checkStateHashes(lay, rng, numWalks, maxDepth):
+    """
+    Walks the game tree like successorBenchmark and returns the number of
+    states whose incrementally updated Zobrist hash differs from a full
+    recompute, counting parents that changed while their successors were
+    generated.  Any mismatch means a rule changed a shared agent state, food
+    Grid or capsule list without copyAgentState, eatFood or eatCapsule.
+    """
+    mismatches = 0
+    for walk in range(numWalks):
+        state = pacman.GameState()
+        state.initialize(lay, lay.getNumGhosts())
+        agentIndex = 0
+        for depth in range(maxDepth):
+            if state.isWin() or state.isLose(): break
+            before = fullHash(state)
+            successors = [state.generateSuccessor(agentIndex, action)
+                          for action in state.getLegalActions(agentIndex)]
+            if hash(state) != before or fullHash(state) != before: mismatches += 1
+            for successor in successors:
+                if hash(successor) != fullHash(successor): mismatches += 1
+            state = rng.choice(successors)
+            agentIndex = (agentIndex + 1) % state.getNumAgents()
+    return mismatches
+
+def successorBenchmark(options=None, numWalks=200, maxDepth=400):
+    """
+    Starting from the initial state of each of SUCCESSOR_LAYOUTS, repeatedly
+    generates every successor of the current state and moves to a random one
+    until the game ends, and reports successors generated per second.  Then
+    checks the incremental state hashes on HASH_CHECK_WALKS more walks (see
+    checkStateHashes), and exits with status 1 if any are wrong.
+    """
+    print('%-16s %10s %8s %12s %11s' % ('layout', 'successors', 'seconds', 'per second', 'bad hashes'))
+    badHashes = 0
+    for layoutName in SUCCESSOR_LAYOUTS:
+        lay = layout.getLayout(layoutName)
+        rng = random.Random(0)
+        calls = 0
+        start = time.time()
+        for walk in range(numWalks):
+            state = pacman.GameState()
+            state.initialize(lay, lay.getNumGhosts())
+            agentIndex = 0
+            for depth in range(maxDepth):
+                if state.isWin() or state.isLose(): break
+                successors = [state.generateSuccessor(agentIndex, action)
+                              for action in state.getLegalActions(agentIndex)]
+                calls += len(successors)
+                state = rng.choice(successors)
+                agentIndex = (agentIndex + 1) % state.getNumAgents()
+        elapsed = time.time() - start
+        mismatches = checkStateHashes(lay, rng, HASH_CHECK_WALKS, maxDepth)
+        badHashes += mismatches
+        print('%-16s %10d %8.2f %12.0f %11d' % (layoutName, calls, elapsed, calls / elapsed, mismatches))
+    if badHashes: sys.exit(1)
+
+SEARCH_FUNCTIONS = ['depthFirstSearch', 'breadthFirstSearch', 'uniformCostSearch', 'aStarSearch']
+
+# Layouts whose name ends with each suffix are searched with the problem,
+# and A* is run once with each of the heuristics
+SEARCH_PROBLEMS = [
+    ('Maze', 'PositionSearchProblem', ['manhattanHeuristic', 'euclideanHeuristic']),
+    ('Corners', 'CornersProblem', ['cornersHeuristic']),
+    ('Search', 'FoodSearchProblem', ['foodHeuristic']),
+]
+
+# Slowdowns of searches faster than this are timer noise, not regressions
+MIN_COMPARED_SECONDS = 0.001
+
+# The result fields kept in the checked in baseline, which any machine reproduces
+BASELINE_FIELDS = ('layout', 'problem', 'fn', 'heuristic', 'status', 'expanded', 'cost')
+
+class ExpansionLimitExceeded(Exception):
+    pass
+
+def limitExpansions(problem, maxExpanded):
+    "Makes problem.getSuccessors raise ExpansionLimitExceeded after maxExpanded calls"
+    getSuccessors = problem.getSuccessors
+    expanded = [0]
+    def limitedGetSuccessors(state):
+        expanded[0] += 1
+        if expanded[0] > maxExpanded: raise ExpansionLimitExceeded()
+        return getSuccessors(state)
+    problem.getSuccessors = limitedGetSuccessors
+
+def searchCases(layoutNames=None):
+    """
+    Lists (layout, problem, search function, heuristic) for every layout in
+    layouts/ (or just layoutNames) that one of SEARCH_PROBLEMS applies to.
+    """
+    if layoutNames is None:
+        layoutNames = sorted([f[:-4] for f in os.listdir('layouts') if f.endswith('.lay')])
+    cases = []
+    for layoutName in layoutNames:
+        for suffix, problemName, heuristics in SEARCH_PROBLEMS:
+            if not layoutName.endswith(suffix): continue
+            for fn in SEARCH_FUNCTIONS:
+                for heuristic in (heuristics if fn == 'aStarSearch' else [None]):
+                    cases.append((layoutName, problemName, fn, heuristic))
+    return cases
+
+def runSearch(case, maxExpanded):
+    """
+    Runs one search case on a fresh problem and returns (seconds, problem,
+    path), where path is None if the search hit maxExpanded.
+    """
+    layoutName, problemName, fn, heuristicName = case
+    function = getattr(search, fn)
+    problem = makeProblem(layoutName, problemName)
+    limitExpansions(problem, maxExpanded)
+    start = time.perf_counter()
+    try:
+        if heuristicName:
+            path = function(problem, getattr(searchAgents, heuristicName))
+        else:
+            path = function(problem)
+    except ExpansionLimitExceeded:
+        path = None
+    return time.perf_counter() - start, problem, path
+
+def benchmarkSearchCase(case, repetitions, warmups, maxExpanded):
+    """
+    Times repetitions runs of case after warmups untimed ones, then measures
+    its peak memory with tracemalloc in one more run, and returns the result
+    as a dictionary.  A case that hits maxExpanded is only run once.
+    """
+    layoutName, problemName, fn, heuristicName = case
+    result = {'layout': layoutName, 'problem': problemName, 'fn': fn, 'heuristic': heuristicName}
+    times = []
+    for run in range(warmups + repetitions):
+        seconds, problem, path = runSearch(case, maxExpanded)
+        if path is None:
+            result.update(status='limit', expanded=maxExpanded, seconds=seconds)
+            return result
+        if run >= warmups: times.append(seconds)
+
+    tracemalloc.start()
+    runSearch(case, maxExpanded)
+    peakMemory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    times.sort()
+    result.update(status='ok', cost=problem.getCostOfActions(path),
+                  seconds=times[len(times) // 2], minSeconds=times[0], peakMemory=peakMemory)
+    result.update(problem.searchStatistics.asDict())
+    del result['wallTime'] # per run; seconds is the median
+    return result
+
+def caseKey(result):
+    return (result['layout'], result['problem'], result['fn'], result['heuristic'])
+
+def compareWithBaseline(results, baseline):
+    """
+    Prints the cases whose status, expansions or path cost differ from the
+    baseline result of the same case and returns the number of regressions:
+    cases that expand more nodes, find a costlier path or stop finishing
+    within the expansion limit.
+    """
+    baselineResults = dict([(caseKey(result), result) for result in baseline['results']])
+    regressions = 0
+    print('%-18s %-22s %-18s %-19s  %s' % ('layout', 'problem', 'fn', 'heuristic', 'changes'))
+    for result in results:
+        old = baselineResults.get(caseKey(result))
+        if old is None: continue
+        notes = []
+        if result['status'] != old['status']:
+            notes.append('%s -> %s' % (old['status'], result['status']))
+            if result['status'] == 'limit': regressions += 1
+        elif result['status'] == 'ok':
+            if result['expanded'] != old['expanded']:
+                notes.append('expanded %d -> %d' % (old['expanded'], result['expanded']))
+                if result['expanded'] > old['expanded']: regressions += 1
+            if result['cost'] != old['cost']:
+                notes.append('cost %s -> %s' % (old['cost'], result['cost']))
+                if result['cost'] > old['cost']: regressions += 1
+        if notes:
+            print('%-18s %-22s %-18s %-19s  %s' %
+                  (result['layout'], result['problem'], result['fn'], result['heuristic'] or '-', ', '.join(notes)))
+    return regressions
+
+def compareTimings(results, timings, tolerance):
+    """
+    Prints how the time of each finished case changed since the same case in
+    timings, an earlier results file from this machine, and returns the
+    number of cases that got slower by more than tolerance (a fraction) and
+    MIN_COMPARED_SECONDS.
+    """
+    oldResults = dict([(caseKey(result), result) for result in timings['results']])
+    slower = 0
+    print('%-18s %-22s %-18s %-19s %8s %8s' % ('layout', 'problem', 'fn', 'heuristic', 'seconds', 'change'))
+    for result in results:
+        old = oldResults.get(caseKey(result))
+        if old is None or not result['status'] == old['status'] == 'ok': continue
+        change = result['seconds'] / old['seconds'] - 1 if old['seconds'] else 0.0
+        slow = change > tolerance and result['seconds'] - old['seconds'] > MIN_COMPARED_SECONDS
+        if slow: slower += 1
+        print('%-18s %-22s %-18s %-19s %8.4f %+7.0f%%  %s' %
+              (result['layout'], result['problem'], result['fn'], result['heuristic'] or '-',
+               result['seconds'], 100 * change, 'SLOWER' if slow else ''))
+    return slower
+
+def searchBenchmark(options):
+    """
+    Runs every search case and writes the results to options.output.  With
+    options.updateBaseline they replace the checked in baseline, and with
+    options.updateTimings the local timings; otherwise they are compared
+    against whichever of the two exist.  Exits with status 1 if there were
+    regressions.
+    """
+    layoutNames = options.layouts.split(',') if options.layouts else None
+    results = []
+    print('%-18s %-22s %-18s %-19s %-6s %9s %8s %10s' %
+          ('layout', 'problem', 'fn', 'heuristic', 'status', 'expanded', 'seconds', 'peak KiB'))
+    for case in searchCases(layoutNames):
+        result = benchmarkSearchCase(case, options.repetitions, options.warmups, options.maxExpanded)
+        results.append(result)
+        print('%-18s %-22s %-18s %-19s %-6s %9d %8.4f %10.0f' %
+              (case[0], case[1], case[2], case[3] or '-', result['status'], result['expanded'],
+               result['seconds'], result.get('peakMemory', 0) / 1024.0))
+
+    output = {'python': sys.version.split()[0], 'repetitions': options.repetitions,
+              'warmups': options.warmups, 'maxExpanded': options.maxExpanded, 'results': results}
+    with open(options.output, 'w') as f:
+        json.dump(output, f, indent=1)
+    print('Wrote %d results to %s' % (len(results), options.output))
+
+    regressions = 0
+    if options.updateBaseline:
+        baseline = {'maxExpanded': options.maxExpanded,
+                    'results': [dict([(field, result.get(field)) for field in BASELINE_FIELDS]) for result in results]}
+        with open(options.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1)
+        print('Updated baseline %s' % options.baseline)
+    elif os.path.exists(options.baseline):
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        print('Comparing expansions and costs against %s' % options.baseline)
+        if baseline['maxExpanded'] != options.maxExpanded:
+            print('Warning: the baseline was recorded with --maxExpanded %d' % baseline['maxExpanded'])
+        found = compareWithBaseline(results, baseline)
+        print('%d regressions' % found)
+        regressions += found
+
+    if options.updateTimings:
+        with open(options.timings, 'w') as f:
+            json.dump(output, f, indent=1)
+        print('Updated timings %s' % options.timings)
+    elif os.path.exists(options.timings):
+        with open(options.timings) as f:
+            timings = json.load(f)
+        print('Comparing times against %s' % options.timings)
+        found = compareTimings(results, timings, options.tolerance)
+        print('%d cases slower' % found)
+        regressions += found
+
+    if regressions: sys.exit(1)
+
+BENCHMARKS = {
+    'queue': queueBenchmark,
+    'successor': successorBenchmark,
+    'search': searchBenchmark,
+}
+
+def readCommand(argv):
+    "Processes the command used to run the benchmarks from the command line."
+    from optparse import OptionParser
+    usageStr = """
+    USAGE:      python bench.py <options> [BENCHMARK ...]
+    BENCHMARKS: %s (all of them by default)
+    EXAMPLES:   (1) python bench.py search
+                    - benchmarks every search case against the baseline
+                (2) python bench.py search --updateTimings
+                    - also records this machine's timings to compare later runs against
+                (3) python bench.py search -l mediumMaze,trickySearch
+                    - benchmarks two layouts
+    """ % ', '.join(sorted(BENCHMARKS))
+    parser = OptionParser(usageStr)
+    parser.add_option('-r', '--repetitions', type='int', dest='repetitions', default=5,
+                      help='timed runs of each search case [Default: %default]')
+    parser.add_option('-w', '--warmups', type='int', dest='warmups', default=1,
+                      help='untimed runs before them [Default: %default]')
+    parser.add_option('-m', '--maxExpanded', type='int', dest='maxExpanded', default=50000,
+                      help='expansions after which a search is given up [Default: %default]')
+    parser.add_option('-l', '--layouts', dest='layouts', default=None,
+                      help='comma separated layouts to search (all by default)')
+    parser.add_option('-o', '--output', dest='output', default='benchResults.json',
+                      help='file to write the search results to [Default: %default]')
+    parser.add_option('-b', '--baseline', dest='baseline', default='benchBaseline.json',
+                      help='expansions and costs to compare against [Default: %default]')
+    parser.add_option('-u', '--updateBaseline', action='store_true', dest='updateBaseline', default=False,
+                      help='replace the baseline with these results instead, after an intended change')
+    parser.add_option('-T', '--timings', dest='timings', default='benchTimings.json',
+                      help='results from this machine to compare times against [Default: %default]')
+    parser.add_option('--updateTimings', action='store_true', dest='updateTimings', default=False,
+                      help='replace the timings with these results instead')
+    parser.add_option('-t', '--tolerance', type='float', dest='tolerance', default=0.25,
+                      help='slowdown, as a fraction, that counts as a regression [Default: %default]')
+    options, names = parser.parse_args(argv)
+    for name in names:
+        if name not in BENCHMARKS:
+            raise Exception('Unknown benchmark %s (choose from %s)' % (name, ', '.join(sorted(BENCHMARKS))))
+    return options, names or sorted(BENCHMARKS)
+
+if __name__ == '__main__':
+    options, names = readCommand(sys.argv[1:])
+    for name in names:
+        BENCHMARKS[name](options)
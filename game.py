@@ -21,6 +21,8 @@
 # For more info, see http://inst.eecs.berkeley.edu/~cs188/sp09/pacman.html
 
 from util import *
+import bisect
+import random
 import time, os
 import traceback
 import sys
@@ -159,11 +161,26 @@ class AgentState:
     def getDirection(self):
         return self.configuration.getDirection()
 
+try:
+    _popcount = int.bit_count
+except AttributeError: # Python < 3.10
+    def _popcount(bits):
+        return bin(bits).count('1')
+
 class Grid:
     """
-    A 2-dimensional array of objects backed by a list of lists.  Data is accessed
-    via grid[x][y] where (x,y) are positions on a Pacman map with x horizontal,
-    y vertical and the origin (0,0) in the bottom left corner.
+    A 2-dimensional array of booleans packed into the bits of a single Python
+    int.  Data is accessed via grid[x][y] where (x,y) are positions on a Pacman
+    map with x horizontal, y vertical and the origin (0,0) in the bottom left
+    corner.
+
+    Cell (x,y) is bit x * height + y of self.bits.  Since ints are immutable,
+    copies share the int until one of them is written to, count() is a
+    popcount and the int itself is the hash.
+
+    The sorted list of True cells is cached together with the bits it was
+    built from.  Copies share the cache and writes update it in place of
+    rebuilding it, so asList() stays O(k) in the number of True cells.
 
     The __str__ method constructs an output that is oriented like a pacman board.
     """
@@ -173,59 +190,90 @@ class Grid:
 
         self.width = width
         self.height = height
-        self.data = [[initialValue for y in range(height)] for x in range(width)]
+        self.bits = (1 << (width * height)) - 1 if initialValue else 0
+        self._trueCells = None # (bits, list of True cells) or None
         if bitRepresentation:
             self._unpackBits(bitRepresentation)
 
     def __getitem__(self, i):
-        return self.data[i]
+        if not 0 <= i < self.width: raise IndexError('Grid column out of range')
+        return GridColumn(self, i)
+
+    def get(self, x, y):
+        "Returns grid[x][y] straight from the bits, without a GridColumn or range checks"
+        return (self.bits >> (x * self.height + y)) & 1 == 1
 
     def __setitem__(self, key, item):
-        self.data[key] = item
+        column = self[key]
+        for y, value in enumerate(item):
+            column[y] = value
+
+    def __iter__(self):
+        for x in range(self.width):
+            yield GridColumn(self, x)
 
     def __str__(self):
-        out = [[str(self.data[x][y])[0] for x in range(self.width)] for y in range(self.height)]
+        out = [[str(self[x][y])[0] for x in range(self.width)] for y in range(self.height)]
         out.reverse()
         return '\n'.join([''.join(x) for x in out])
 
     def __eq__(self, other):
         if other == None: return False
-        return self.data == other.data
+        return self.bits == other.bits and self.width == other.width and self.height == other.height
 
     def __hash__(self):
-        # return hash(str(self))
-        base = 1
-        h = 0
-        for l in self.data:
-            for i in l:
-                if i:
-                    h += base
-                base *= 2
-        return hash(h)
+        return hash(self.bits)
 
     def copy(self):
         g = Grid(self.width, self.height)
-        g.data = [x[:] for x in self.data]
+        g.bits = self.bits
+        g._trueCells = self._trueCells
         return g
 
     def deepCopy(self):
         return self.copy()
 
     def shallowCopy(self):
-        g = Grid(self.width, self.height)
-        g.data = self.data
-        return g
+        return self.copy()
 
     def count(self, item =True ):
-        return sum([x.count(item) for x in self.data])
+        setBits = _popcount(self.bits)
+        if item: return setBits
+        return self.width * self.height - setBits
 
     def asList(self, key = True):
+        if key:
+            cache = self._trueCells
+            if cache is None or cache[0] != self.bits:
+                cache = self._trueCells = (self.bits, self._cellsOf(self.bits))
+            return cache[1][:]
+        return self._cellsOf(self.bits ^ ((1 << (self.width * self.height)) - 1))
+
+    def _cellsOf(self, bits):
+        "Returns the (x,y) positions of the set bits of bits, in bit order"
         list = []
-        for x in range(self.width):
-            for y in range(self.height):
-                if self[x][y] == key: list.append( (x,y) )
+        while bits:
+            lowest = bits & -bits
+            list.append(divmod(lowest.bit_length() - 1, self.height))
+            bits ^= lowest
         return list
 
+    def _setBit(self, x, y, value):
+        bit = 1 << (x * self.height + y)
+        oldBits = self.bits
+        newBits = oldBits | bit if value else oldBits & ~bit
+        if newBits == oldBits: return
+        cache = self._trueCells
+        if cache is not None and cache[0] == oldBits:
+            # The cached list may be shared with copies, so edit a new one
+            cells = cache[1][:]
+            if value:
+                bisect.insort(cells, (x, y))
+            else:
+                cells.remove((x, y))
+            self._trueCells = (newBits, cells)
+        self.bits = newBits
+
     def packBits(self):
         """
         Returns an efficient int list representation
@@ -246,7 +294,7 @@ class Grid:
         return tuple(bits)
 
     def _cellIndexToPosition(self, index):
-        x = index / self.height
+        x = index // self.height
         y = index % self.height
         return x, y
 
@@ -274,6 +322,36 @@ class Grid:
                 bools.append(False)
         return bools
 
+class GridColumn:
+    """
+    A view of column x of a Grid, so that grid[x][y] reads and writes bit
+    x * height + y of the grid's int.
+    """
+    __slots__ = ('grid', 'x', 'offset', 'height')
+
+    def __init__(self, grid, x):
+        self.grid = grid
+        self.x = x
+        self.offset = x * grid.height
+        self.height = grid.height
+
+    def __getitem__(self, y):
+        if not 0 <= y < self.height: raise IndexError('Grid row out of range')
+        return (self.grid.bits >> (self.offset + y)) & 1 == 1
+
+    def __setitem__(self, y, value):
+        if not 0 <= y < self.height: raise IndexError('Grid row out of range')
+        if value not in [False, True]: raise Exception('Grids can only contain booleans')
+        self.grid._setBit(self.x, y, value)
+
+    def __len__(self):
+        return self.height
+
+    def __iter__(self):
+        column = self.grid.bits >> self.offset
+        for y in range(self.height):
+            yield (column >> y) & 1 == 1
+
 def reconstituteGrid(bitRep):
     if type(bitRep) is not type((1,2)):
         return bitRep
@@ -342,7 +420,7 @@ class Actions:
             dx, dy = vec
             next_y = y_int + dy
             next_x = x_int + dx
-            if not walls[next_x][next_y]: possible.append(dir)
+            if not walls.get(next_x, next_y): possible.append(dir)
 
         return possible
 
@@ -358,7 +436,7 @@ class Actions:
             if next_x < 0 or next_x == walls.width: continue
             next_y = y_int + dy
             if next_y < 0 or next_y == walls.height: continue
-            if not walls[next_x][next_y]: neighbors.append((next_x, next_y))
+            if not walls.get(next_x, next_y): neighbors.append((next_x, next_y))
         return neighbors
     getLegalNeighbors = staticmethod(getLegalNeighbors)
 
@@ -368,21 +446,97 @@ class Actions:
         return (x + dx, y + dy)
     getSuccessor = staticmethod(getSuccessor)
 
+    _successorTables = {}
+
+    def getSuccessorTable(walls):
+        """
+        Returns a dict from every cell (x,y) of walls to a tuple of the
+        ((nextx, nexty), action) pairs that do not run into a wall, listed in
+        North, South, East, West order.  Tables are built once per wall layout
+        and shared, so search problems can look successors up instead of
+        recomputing them on every expansion.
+        """
+        key = (walls.width, walls.height, walls.bits)
+        table = Actions._successorTables.get(key)
+        if table is None:
+            moves = [(Directions.NORTH, (0, 1)), (Directions.SOUTH, (0, -1)),
+                     (Directions.EAST, (1, 0)), (Directions.WEST, (-1, 0))]
+            table = {}
+            for x in range(walls.width):
+                for y in range(walls.height):
+                    successors = []
+                    for action, (dx, dy) in moves:
+                        nextx, nexty = x + dx, y + dy
+                        if 0 <= nextx < walls.width and 0 <= nexty < walls.height and not walls.get(nextx, nexty):
+                            successors.append(((nextx, nexty), action))
+                    table[(x, y)] = tuple(successors)
+            Actions._successorTables[key] = table
+        return table
+    getSuccessorTable = staticmethod(getSuccessorTable)
+
+    def getIndexedSuccessorTable(walls, cellBits):
+        """
+        Returns getSuccessorTable(walls) keyed by cell index x * height + y,
+        as Grid numbers cells, with successors as ((nextIndex, bit), action)
+        pairs, where bit is cellBits.get((nextx, nexty), 0).  Used by search
+        problems whose states are (cell index, mask of cells left) pairs.
+        """
+        height = walls.height
+        table = {}
+        for (x, y), successors in Actions.getSuccessorTable(walls).items():
+            table[x * height + y] = tuple(((nextx * height + nexty, cellBits.get((nextx, nexty), 0)), action)
+                                          for (nextx, nexty), action in successors)
+        return table
+    getIndexedSuccessorTable = staticmethod(getIndexedSuccessorTable)
+
+_zobristKeys = {}
+_zobristRandom = random.Random(188)
+
+def zobristKey(feature):
+    """
+    Returns the random 64-bit key of a hashable state feature, such as
+    ('food', x, y).  Keys are drawn the first time a feature is seen.
+    """
+    key = _zobristKeys.get(feature)
+    if key is None:
+        key = _zobristKeys[feature] = _zobristRandom.getrandbits(64)
+    return key
+
+def agentZobristKey(agentIndex, agentState):
+    configuration = agentState.configuration
+    if configuration is None:
+        return zobristKey(('agent', agentIndex, None, None, agentState.scaredTimer))
+    return zobristKey(('agent', agentIndex, configuration.pos, configuration.direction, agentState.scaredTimer))
+
 class GameStateData:
     """
+    The food, capsules, agent states and score of a game, plus flags describing
+    the last move.
 
+    States are hashed Zobrist style: self._hash is the XOR of the keys of
+    every agent state, remaining food dot and capsule, and is kept up to date
+    as the rules change the state (copyAgentState, eatFood, eatCapsule), so
+    hashing a successor costs O(1) whatever the size of the board.
     """
     def __init__( self, prevState = None ):
         """
-        Generates a new data packet by copying information from its predecessor.
+        Generates a new data packet that shares its predecessor's information.
+
+        The food Grid, capsule list and AgentStates are shared with prevState
+        rather than copied.  Code that changes one of them must first replace
+        it with a copy: see copyAgentState, eatFood and eatCapsule.
         """
+        self._hash = None
+        self._changedAgents = []
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            self.food = prevState.food
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
+            prevState._updateAgentHashes()
+            self._hash = prevState._hash
 
         self._foodEaten = None
         self._foodAdded = None
@@ -395,6 +549,8 @@ class GameStateData:
     def deepCopy( self ):
         state = GameStateData( self )
         state.food = self.food.deepCopy()
+        state.capsules = self.capsules[:]
+        state.agentStates = self.copyAgentStates( self.agentStates )
         state.layout = self.layout.deepCopy()
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
@@ -402,6 +558,57 @@ class GameStateData:
         state._capsuleEaten = self._capsuleEaten
         return state
 
+    def copyAgentState( self, agentIndex ):
+        """
+        Replaces the state of agent agentIndex with a private copy, so that it
+        can be changed without affecting the states this one shares it with,
+        and returns the copy.  Asking again before the state is next hashed
+        or copied returns the same copy.
+
+        The agent's key leaves the hash now and its new key joins it once the
+        changes are done, on the next hash or copy of this state.
+        """
+        if agentIndex in self._changedAgents:
+            return self.agentStates[agentIndex]
+        agentState = self.agentStates[agentIndex]
+        if self._hash is not None:
+            self._hash ^= agentZobristKey(agentIndex, agentState)
+        agentState = agentState.copy()
+        self.agentStates[agentIndex] = agentState
+        self._changedAgents.append(agentIndex)
+        return agentState
+
+    def eatFood( self, x, y ):
+        "Removes the food at (x,y), copying the shared food Grid first"
+        self.food = self.food.copy()
+        self.food[x][y] = False
+        if self._hash is not None:
+            self._hash ^= zobristKey(('food', x, y))
+
+    def eatCapsule( self, position ):
+        "Removes the capsule at position from a new capsule list"
+        self.capsules = [capsule for capsule in self.capsules if capsule != position]
+        if self._hash is not None:
+            self._hash ^= zobristKey(('capsule', position))
+
+    def _updateAgentHashes( self ):
+        "Adds the keys of agents changed since the last update to the hash"
+        if self._changedAgents:
+            if self._hash is not None:
+                for agentIndex in self._changedAgents:
+                    self._hash ^= agentZobristKey(agentIndex, self.agentStates[agentIndex])
+            self._changedAgents = []
+
+    def _zobristHash( self ):
+        h = 0
+        for x, y in self.food.asList():
+            h ^= zobristKey(('food', x, y))
+        for capsule in self.capsules:
+            h ^= zobristKey(('capsule', capsule))
+        for agentIndex, agentState in enumerate(self.agentStates):
+            h ^= agentZobristKey(agentIndex, agentState)
+        return h
+
     def copyAgentStates( self, agentStates ):
         copiedStates = []
         for agentState in agentStates:
@@ -424,23 +631,19 @@ class GameStateData:
         """
         Allows states to be keys of dictionaries.
         """
-        for i, state in enumerate( self.agentStates ):
-            try:
-                int(hash(state))
-            except TypeError as e:
-                print(e)
-                #hash(state)
-        return int((hash(tuple(self.agentStates)) + 13*hash(self.food) + 113* hash(tuple(self.capsules)) + 7 * hash(self.score)) % 1048575 )
+        if self._hash is None:
+            self._hash = self._zobristHash()
+            self._changedAgents = []
+        else:
+            self._updateAgentHashes()
+        return hash((self._hash, self.score))
 
     def __str__( self ):
         width, height = self.layout.width, self.layout.height
-        map = Grid(width, height)
         if type(self.food) == type((1,2)):
             self.food = reconstituteGrid(self.food)
-        for x in range(width):
-            for y in range(height):
-                food, walls = self.food, self.layout.walls
-                map[x][y] = self._foodWallStr(food[x][y], walls[x][y])
+        food, walls = self.food, self.layout.walls
+        map = [[self._foodWallStr(food[x][y], walls[x][y]) for y in range(height)] for x in range(width)]
 
         for agentState in self.agentStates:
             if agentState == None: continue
@@ -455,7 +658,9 @@ class GameStateData:
         for x, y in self.capsules:
             map[x][y] = 'o'
 
-        return str(map) + ("\nScore: %d\n" % self.score)
+        rows = [''.join([map[x][y] for x in range(width)]) for y in range(height)]
+        rows.reverse()
+        return '\n'.join(rows) + ("\nScore: %d\n" % self.score)
 
     def _foodWallStr( self, hasFood, hasWall ):
         if hasFood:
@@ -503,6 +708,7 @@ class GameStateData:
                 else: numGhosts += 1
             self.agentStates.append( AgentState( Configuration( pos, Directions.STOP), isPacman) )
         self._eaten = [False for a in self.agentStates]
+        self._hash = self._zobristHash()
 
 try:
     import boinc
@@ -510,6 +716,56 @@ try:
 except:
     _BOINC_ENABLED = False
 
+class AgentProfile:
+    """
+    Where one agent's time went: the seconds it spent in registerInitialState
+    and on each move (observation and getAction), and how many times the
+    state's generateSuccessor and getLegalActions were called meanwhile.
+    Profiles of the same agent from several games can be merged.
+    """
+    def __init__( self, agentType=None ):
+        self.agentType = agentType
+        self.startupTime = 0.0
+        self.moveTimes = []
+        self.successorCalls = 0
+        self.legalActionCalls = 0
+
+    def recordStartup( self, seconds, countsBefore, countsAfter ):
+        self.startupTime += seconds
+        self.successorCalls += countsAfter[0] - countsBefore[0]
+        self.legalActionCalls += countsAfter[1] - countsBefore[1]
+
+    def recordMove( self, seconds, countsBefore, countsAfter ):
+        self.moveTimes.append(seconds)
+        self.successorCalls += countsAfter[0] - countsBefore[0]
+        self.legalActionCalls += countsAfter[1] - countsBefore[1]
+
+    def merge( self, other ):
+        if self.agentType is None: self.agentType = other.agentType
+        self.startupTime += other.startupTime
+        self.moveTimes.extend(other.moveTimes)
+        self.successorCalls += other.successorCalls
+        self.legalActionCalls += other.legalActionCalls
+
+    def summary( self ):
+        "A dictionary of totals and move latency percentiles (in milliseconds), for JSON"
+        times = sorted(self.moveTimes)
+        def percentile(p):
+            if not times: return 0.0
+            return 1000 * times[min(len(times) - 1, int(p / 100.0 * len(times)))]
+        moveTime = sum(times)
+        return {'agent': self.agentType,
+                'moves': len(times),
+                'startupSeconds': self.startupTime,
+                'moveSeconds': moveTime,
+                'meanMoveMs': 1000 * moveTime / len(times) if times else 0.0,
+                'p50MoveMs': percentile(50),
+                'p95MoveMs': percentile(95),
+                'p99MoveMs': percentile(99),
+                'maxMoveMs': 1000 * times[-1] if times else 0.0,
+                'generateSuccessorCalls': self.successorCalls,
+                'getLegalActionsCalls': self.legalActionCalls}
+
 class Game:
     """
     The Game manages the control flow, soliciting actions from agents.
@@ -528,6 +784,7 @@ class Game:
         self.totalAgentTimes = [0 for agent in agents]
         self.totalAgentTimeWarnings = [0 for agent in agents]
         self.agentTimeout = False
+        self.profiles = [AgentProfile(agent.__class__.__name__ if agent else None) for agent in agents]
         import io
         self.agentOutput = [io.StringIO() for agent in agents]
 
@@ -570,6 +827,7 @@ class Game:
         """
         self.display.initialize(self.state.data)
         self.numMoves = 0
+        callCounts = self._getCallCounts()
 
         ###self.display.initialize(self.state.makeObservation(1).data)
         # inform learning agents of the game start
@@ -583,11 +841,16 @@ class Game:
                 self.unmute()
                 self._agentCrash(i, quiet=True)
                 return
+            if ("setMoveTimeout" in dir(agent)):
+                agent.setMoveTimeout(self.rules.getMoveTimeout(i))
+            if ("setMaxTotalTime" in dir(agent)):
+                agent.setMaxTotalTime(self.rules.getMaxTotalTime(i))
             if ("registerInitialState" in dir(agent)):
+                profileStart, countsStart = time.perf_counter(), callCounts()
                 self.mute(i)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.registerInitialState, int(self.rules.getMaxStartupTime(i)))
+                        timed_func = TimeoutFunction(agent.registerInitialState, self.rules.getMaxStartupTime(i))
                         try:
                             start_time = time.time()
                             timed_func(self.state.deepCopy())
@@ -607,6 +870,7 @@ class Game:
                     agent.registerInitialState(self.state.deepCopy())
                 ## TODO: could this exceed the total time
                 self.unmute()
+                self.profiles[i].recordStartup(time.perf_counter() - profileStart, countsStart, callCounts())
 
         agentIndex = self.startingIndex
         numAgents = len( self.agents )
@@ -616,12 +880,13 @@ class Game:
             agent = self.agents[agentIndex]
             move_time = 0
             skip_action = False
+            profileStart, countsStart = time.perf_counter(), callCounts()
             # Generate an observation of the state
             if 'observationFunction' in dir( agent ):
                 self.mute(agentIndex)
                 if self.catchExceptions:
                     try:
-                        timed_func = TimeoutFunction(agent.observationFunction, int(self.rules.getMoveTimeout(agentIndex)))
+                        timed_func = TimeoutFunction(agent.observationFunction, self.rules.getMoveTimeout(agentIndex))
                         try:
                             start_time = time.time()
                             observation = timed_func(self.state.deepCopy())
@@ -644,7 +909,10 @@ class Game:
             self.mute(agentIndex)
             if self.catchExceptions:
                 try:
-                    timed_func = TimeoutFunction(agent.getAction, int(self.rules.getMoveTimeout(agentIndex)) - int(move_time))
+                    deadline = Deadline(self.rules.getMoveTimeout(agentIndex) - move_time)
+                    if 'setDeadline' in dir(agent):
+                        agent.setDeadline(deadline)
+                    timed_func = TimeoutFunction(agent.getAction, deadline)
                     try:
                         start_time = time.time()
                         if skip_action:
@@ -685,6 +953,7 @@ class Game:
             else:
                 action = agent.getAction(observation)
             self.unmute()
+            self.profiles[agentIndex].recordMove(time.perf_counter() - profileStart, countsStart, callCounts())
 
             # Execute the action
             self.moveHistory.append( (agentIndex, action) )
@@ -727,3 +996,50 @@ class Game:
                     self.unmute()
                     return
         self.display.finish()
+
+    def _getCallCounts( self ):
+        "Returns a function giving the state class's running call counts, or (0, 0) if it keeps none"
+        return getattr(self.state, 'getCallCounts', lambda: (0, 0))
+
+    def runHeadless( self ):
+        """
+        Plays the game without a display, timeouts, muting, exception handling
+        or a move history, for trusted agents in bulk evaluation and training.
+        Agents see the game's own (immutable) states rather than copies.
+        """
+        agents = self.agents
+        numAgents = len( agents )
+        callCounts = self._getCallCounts()
+        profiles = self.profiles
+        clock = time.perf_counter
+        for i, agent in enumerate(agents):
+            if hasattr(agent, 'setMoveTimeout'):
+                agent.setMoveTimeout(self.rules.getMoveTimeout(i))
+            if hasattr(agent, 'setMaxTotalTime'):
+                agent.setMaxTotalTime(self.rules.getMaxTotalTime(i))
+            if hasattr(agent, 'registerInitialState'):
+                profileStart, countsStart = clock(), callCounts()
+                agent.registerInitialState(self.state)
+                profiles[i].recordStartup(clock() - profileStart, countsStart, callCounts())
+        observers = [getattr(agent, 'observationFunction', None) for agent in agents]
+        getActions = [agent.getAction for agent in agents]
+        recordMoves = [profile.recordMove for profile in profiles]
+        process = self.rules.process
+        self.numMoves = 0
+
+        agentIndex = self.startingIndex
+        while not self.gameOver:
+            state = self.state
+            observer = observers[agentIndex]
+            countsStart = callCounts()
+            profileStart = clock()
+            action = getActions[agentIndex](observer(state) if observer else state)
+            recordMoves[agentIndex](clock() - profileStart, countsStart, callCounts())
+            self.state = state.generateSuccessor( agentIndex, action )
+            process(self.state, self)
+            agentIndex += 1
+            if agentIndex == numAgents: agentIndex = 0
+
+        for agent in agents:
+            if hasattr(agent, 'final'):
+                agent.final( self.state )
@@ -14,10 +14,23 @@
 
 from util import manhattanDistance
 from game import Grid
+from array import array
+import hashlib
+import mmap
 import os
 import random
+import struct
+import sys
 
 VISIBILITY_MATRIX_CACHE = {}
+MAZE_DISTANCES_CACHE = {}
+
+# Full distance tables are also kept on disk, one file per layout text, so
+# that new processes can map them instead of recomputing them.  Set
+# DISTANCE_CACHE_DIR to None to turn this off.  Tables for layouts with more
+# than DISTANCE_CACHE_MAX_CELLS open cells are only ever built in memory.
+DISTANCE_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.distance_cache')
+DISTANCE_CACHE_MAX_CELLS = 4096
 
 class Layout:
     """
@@ -34,7 +47,8 @@ class Layout:
         self.numGhosts = 0
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
-        self.totalFood = len(self.food.asList())
+        self.totalFood = self.food.count()
+        self._mazeDistances = None
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
@@ -61,9 +75,21 @@ class Layout:
         else:
             self.visibility = VISIBILITY_MATRIX_CACHE[reduce(str.__add__, self.layoutText)]
 
+    def getMazeDistances(self):
+        """
+        Returns the MazeDistances for this layout's walls.  The table is shared
+        by every Layout built from the same text in this process.
+        """
+        if self._mazeDistances is None:
+            key = '\n'.join(self.layoutText)
+            if key not in MAZE_DISTANCES_CACHE:
+                MAZE_DISTANCES_CACHE[key] = loadMazeDistances(key, self.walls)
+            self._mazeDistances = MAZE_DISTANCES_CACHE[key]
+        return self._mazeDistances
+
     def isWall(self, pos):
         x, col = pos
-        return self.walls[x][col]
+        return self.walls.get(x, col)
 
     def getRandomLegalPosition(self):
         x = random.choice(range(self.width))
@@ -128,6 +154,133 @@ class Layout:
         elif layoutChar in  ['1', '2', '3', '4']:
             self.agentPositions.append( (int(layoutChar), (x,y)))
             self.numGhosts += 1
+
+class MazeDistances:
+    """
+    All-pairs shortest path lengths between the open cells of a walls Grid.
+
+    Open cells are numbered column by column and distances are kept in one
+    compact array row per source cell.  A row is filled by a breadth first
+    search the first time a distance from (or to) its cell is asked for, so
+    after that getDistance is two dict lookups and an array index.
+    """
+    def __init__(self, walls):
+        self.width, self.height = walls.width, walls.height
+        self.cells = [(x, y) for x in range(self.width) for y in range(self.height) if not walls.get(x, y)]
+        self.cellIndex = dict((cell, i) for i, cell in enumerate(self.cells))
+        self.neighbors = []
+        for x, y in self.cells:
+            adjacent = [(x, y + 1), (x, y - 1), (x + 1, y), (x - 1, y)]
+            self.neighbors.append([self.cellIndex[cell] for cell in adjacent if cell in self.cellIndex])
+
+        # Path lengths are bounded by the number of open cells
+        self.typecode = 'H' if len(self.cells) < 0xFFFF else 'I'
+        self.unreachable = 0xFFFF if self.typecode == 'H' else 0xFFFFFFFF
+        self.rows = [None for cell in self.cells]
+
+    def getDistance(self, pos1, pos2):
+        """
+        Returns the maze distance between two open cells, or infinity if there
+        is no path between them.
+        """
+        i, j = self.cellIndex[pos1], self.cellIndex[pos2]
+        row = self.rows[i]
+        if row is None:
+            row = self.rows[j]
+            if row is None:
+                row = self.getRow(i)
+            else:
+                i, j = j, i
+        distance = row[j]
+        if distance == self.unreachable: return float('inf')
+        return distance
+
+    def getRow(self, source):
+        "Returns the distances from the cell numbered source to every open cell"
+        if self.rows[source] is None:
+            self.rows[source] = self._breadthFirstRow(source)
+        return self.rows[source]
+
+    def computeAll(self):
+        "Fills in every row of the table"
+        for i in range(len(self.cells)):
+            self.getRow(i)
+
+    def _breadthFirstRow(self, source):
+        unreachable, neighbors = self.unreachable, self.neighbors
+        row = array(self.typecode, [unreachable]) * len(self.cells)
+        row[source] = 0
+        frontier = [source]
+        distance = 0
+        while frontier:
+            distance += 1
+            nextFrontier = []
+            for cell in frontier:
+                for neighbor in neighbors[cell]:
+                    if row[neighbor] == unreachable:
+                        row[neighbor] = distance
+                        nextFrontier.append(neighbor)
+            frontier = nextFrontier
+        return row
+
+# magic, sha1 of the layout text, width, height, number of open cells,
+# array typecode, byte order
+_DISTANCE_FILE_HEADER = struct.Struct('=4s20sIII1s1s2x')
+_DISTANCE_FILE_MAGIC = b'PMD1'
+
+def loadMazeDistances(layoutKey, walls):
+    """
+    Returns a complete MazeDistances for walls, memory-mapped from its file in
+    DISTANCE_CACHE_DIR.  A missing or stale file (one whose header does not
+    match the layout, or that was cut short) is rebuilt first.  Falls back to
+    a lazily filled in-memory table when the cache is disabled, the layout is
+    too large or the cache directory cannot be written.
+    """
+    distances = MazeDistances(walls)
+    if DISTANCE_CACHE_DIR is None or len(distances.cells) > DISTANCE_CACHE_MAX_CELLS:
+        return distances
+
+    digest = hashlib.sha1(layoutKey.encode('utf-8')).digest()
+    path = os.path.join(DISTANCE_CACHE_DIR, digest.hex() + '.dist')
+    header = _DISTANCE_FILE_HEADER.pack(_DISTANCE_FILE_MAGIC, digest, distances.width, distances.height,
+                                        len(distances.cells), distances.typecode.encode('ascii'),
+                                        sys.byteorder[0].encode('ascii'))
+    try:
+        if not _mapDistanceFile(distances, path, header):
+            _writeDistanceFile(distances, path, header)
+            if not _mapDistanceFile(distances, path, header):
+                raise OSError('could not map distance cache file ' + path)
+    except OSError:
+        distances = MazeDistances(walls)
+    return distances
+
+def _mapDistanceFile(distances, path, header):
+    "Attaches the table in path to distances; returns False if it is missing or stale"
+    if not os.path.exists(path): return False
+    numCells = len(distances.cells)
+    expectedSize = len(header) + numCells * numCells * array(distances.typecode).itemsize
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size != expectedSize or f.read(len(header)) != header:
+            return False
+        if numCells == 0: return True
+        table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(table)[len(header):].cast(distances.typecode)
+    distances.rows = [view[i * numCells:(i + 1) * numCells] for i in range(numCells)]
+    distances._mappedTable = table
+    return True
+
+def _writeDistanceFile(distances, path, header):
+    "Computes every row of distances and writes them to path atomically"
+    distances.computeAll()
+    if not os.path.isdir(DISTANCE_CACHE_DIR):
+        os.makedirs(DISTANCE_CACHE_DIR, exist_ok=True)
+    tmpPath = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmpPath, 'wb') as f:
+        f.write(header)
+        for row in distances.rows:
+            row.tofile(f)
+    os.replace(tmpPath, path)
+
 def getLayout(name, back = 2):
     if name.endswith('.lay'):
         layout = tryToLoad('layouts/' + name)
@@ -147,3 +300,11 @@ def tryToLoad(fullname):
     f = open(fullname)
     try: return Layout([line.strip() for line in f])
     finally: f.close()
+
+if __name__ == '__main__':
+    # Builds the on-disk distance tables of every bundled layout, e.g. before
+    # starting a batch of games in many processes.
+    for fileName in sorted(os.listdir('layouts')):
+        if fileName.endswith('.lay'):
+            getLayout(fileName).getMazeDistances()
+            print('Cached distances for ' + fileName)
@@ -43,6 +43,7 @@ from game import GameStateData
 from game import Game
 from game import Directions
 from game import Actions
+from game import Configuration
 from util import nearestPoint
 from util import manhattanDistance
 import util, layout
@@ -71,19 +72,56 @@ class GameState:
     # Accessor methods: use these to access state data #
     ####################################################
 
-    # static variable keeps track of which states have had getLegalActions called
-    explored = set()
+    # static variable keeps track of which states have had generateSuccessor
+    # called.  It stays None, and costs nothing, until tracking is turned on
+    # by trackExplored or the first call to getAndResetExplored.
+    explored = None
+
+    def trackExplored(maxStates=None):
+        """
+        Starts counting generateSuccessor calls and remembering the distinct
+        states involved, up to maxStates of them (MAX_EXPLORED_STATES by
+        default; 0 only counts, which avoids hashing states altogether).
+        """
+        if maxStates is None: maxStates = MAX_EXPLORED_STATES
+        GameState.explored = ExploredStates(maxStates)
+    trackExplored = staticmethod(trackExplored)
+
     def getAndResetExplored():
-        tmp = GameState.explored.copy()
-        GameState.explored = set()
-        return tmp
+        """
+        Returns the set of states seen by generateSuccessor since the last
+        reset (empty on the first call, which turns tracking on) and resets it.
+        """
+        tmp = GameState.explored
+        if tmp is None:
+            GameState.trackExplored()
+            return set()
+        GameState.explored = ExploredStates(tmp.maxStates)
+        return tmp.states
     getAndResetExplored = staticmethod(getAndResetExplored)
 
+    def getExploredCount():
+        "Returns the number of generateSuccessor calls since tracking was last reset"
+        if GameState.explored is None: return 0
+        return GameState.explored.count
+    getExploredCount = staticmethod(getExploredCount)
+
+    # static counts of getLegalActions and generateSuccessor calls, which
+    # Game uses to profile its agents
+    numLegalActionCalls = 0
+    numSuccessorCalls = 0
+
+    def getCallCounts():
+        "Returns the (generateSuccessor, getLegalActions) calls made so far"
+        return GameState.numSuccessorCalls, GameState.numLegalActionCalls
+    getCallCounts = staticmethod(getCallCounts)
+
     def getLegalActions( self, agentIndex=0 ):
         """
         Returns the legal actions for the agent specified.
         """
 #        GameState.explored.add(self)
+        GameState.numLegalActionCalls += 1
         if self.isWin() or self.isLose(): return []
 
         if agentIndex == 0:  # Pacman is moving
@@ -97,8 +135,9 @@ class GameState:
         """
         # Check that successors exist
         if self.isWin() or self.isLose(): raise Exception('Can\'t generate a successor of a terminal state.')
+        GameState.numSuccessorCalls += 1
 
-        # Copy current state
+        # Start from the current state; the rules copy whatever they change
         state = GameState(self)
 
         # Let agent's logic deal with its action's effects on the board
@@ -120,8 +159,8 @@ class GameState:
         # Book keeping
         state.data._agentMoved = agentIndex
         state.data.score += state.data.scoreChange
-        GameState.explored.add(self)
-        GameState.explored.add(state)
+        if GameState.explored is not None:
+            GameState.explored.add(self, state)
         return state
 
     def getLegalPacmanActions( self ):
@@ -201,10 +240,10 @@ class GameState:
         return self.data.layout.walls
 
     def hasFood(self, x, y):
-        return self.data.food[x][y]
+        return self.data.food.get(x, y)
 
     def hasWall(self, x, y):
-        return self.data.layout.walls[x][y]
+        return self.data.layout.walls.get(x, y)
 
     def isLose( self ):
         return self.data._lose
@@ -253,12 +292,29 @@ class GameState:
         """
         self.data.initialize(layout, numGhostAgents)
 
+class ExploredStates:
+    """
+    Counts generateSuccessor calls and keeps the distinct states they involve,
+    up to maxStates of them, for GameState.getAndResetExplored.
+    """
+    def __init__(self, maxStates):
+        self.maxStates = maxStates
+        self.count = 0
+        self.states = set()
+
+    def add(self, parent, child):
+        self.count += 1
+        if len(self.states) < self.maxStates:
+            self.states.add(parent)
+            self.states.add(child)
+
 ############################################################################
 #                     THE HIDDEN SECRETS OF PACMAN                         #
 #                                                                          #
 # You shouldn't need to look through the code in this section of the file. #
 ############################################################################
 
+MAX_EXPLORED_STATES = 100000 # Default cap on states remembered by GameState.explored
 SCARED_TIME = 40    # Moves ghosts are scared
 COLLISION_TOLERANCE = 0.7 # How close ghosts must be to Pacman to kill
 TIME_PENALTY = 1 # Number of points lost each round
@@ -275,6 +331,9 @@ class ClassicGameRules:
         agents = [pacmanAgent] + ghostAgents[:layout.getNumGhosts()]
         initState = GameState()
         initState.initialize( layout, len(ghostAgents) )
+        if GameState.explored is not None:
+            # Explored states are counted per game
+            GameState.trackExplored(GameState.explored.maxStates)
         game = Game(agents, display, self, catchExceptions=catchExceptions)
         game.state = initState
         self.initialState = initState.deepCopy()
@@ -342,7 +401,7 @@ class PacmanRules:
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.copyAgentState( 0 )
 
         # Update Configuration
         vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
@@ -359,23 +418,20 @@ class PacmanRules:
     def consume( position, state ):
         x,y = position
         # Eat food
-        if state.data.food[x][y]:
+        if state.data.food.get(x, y):
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
+            state.data.eatFood( x, y )
             state.data._foodEaten = position
-            # TODO: cache numFood?
-            numFood = state.getNumFood()
-            if numFood == 0 and not state.data._lose:
+            if state.getNumFood() == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
-            state.data.capsules.remove( position )
+            state.data.eatCapsule( position )
             state.data._capsuleEaten = position
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.copyAgentState( index ).scaredTimer = SCARED_TIME
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -404,7 +460,7 @@ class GhostRules:
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.copyAgentState( ghostIndex )
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector( action, speed )
@@ -414,7 +470,9 @@ class GhostRules:
     def decrementTimer( ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
+            # Configurations are shared between states, so snap to a new one
+            configuration = ghostState.configuration
+            ghostState.configuration = Configuration( nearestPoint( configuration.pos ), configuration.direction )
         ghostState.scaredTimer = max( 0, timer - 1 )
     decrementTimer = staticmethod( decrementTimer )
 
@@ -436,9 +494,11 @@ class GhostRules:
     def collide( state, ghostState, agentIndex):
         if ghostState.scaredTimer > 0:
             state.data.scoreChange += 200
+            ghostState = state.data.copyAgentState( agentIndex )
             GhostRules.placeGhost(state, ghostState)
             ghostState.scaredTimer = 0
             # Added for first-person
+            state.data._eaten = state.data._eaten[:]
             state.data._eaten[agentIndex] = True
         else:
             if not state.data._win:
@@ -523,6 +583,12 @@ def readCommand( argv ):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--workers', dest='workers', type='int',
+                      help='Number of processes to spread quiet games across, each game seeded on its own', default=None)
+    parser.add_option('--profile', dest='profile',
+                      help='Write per-agent move times and state call counts to this JSON file', default=None)
+    parser.add_option('--headless', action='store_true', dest='headless',
+                      help='Play quiet games as fast as possible, without timeouts, for trusted agents', default=False)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -532,6 +598,18 @@ def readCommand( argv ):
     # Fix the random seed
     if options.fixRandomSeed: random.seed('cs188')
 
+    # Games played by workers or headless are never displayed
+    if options.workers is not None:
+        if options.workers < 1:
+            raise Exception('--workers must be at least 1')
+        if options.record or options.numTraining > 0:
+            raise Exception('--workers cannot be used to record games or train agents')
+        options.quietGraphics = True
+    if options.headless:
+        if options.record or options.catchExceptions:
+            raise Exception('--headless games cannot be recorded or catch exceptions')
+        options.quietGraphics = True
+
     # Choose a layout
     args['layout'] = layout.getLayout( options.layout )
     if args['layout'] == None: raise Exception("The layout " + options.layout + " cannot be found")
@@ -570,6 +648,13 @@ def readCommand( argv ):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    args['headless'] = options.headless
+    args['profile'] = options.profile
+    if options.workers is not None:
+        # Every game builds its own agents and is seeded on its own, however many workers play them
+        args['workers'] = options.workers
+        args['agentSpec'] = (options.pacman, agentOpts, options.ghost, options.numGhosts)
+        args['seed'] = 'cs188' if options.fixRandomSeed else str(random.random())
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
@@ -625,12 +710,17 @@ def replayGame( layout, actions, display ):
 
     display.finish()
 
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30,
+              workers=None, agentSpec=None, seed=None, headless=False, profile=None ):
+    if workers is not None:
+        return runParallelGames(layout, agentSpec, numGames, workers, catchExceptions, timeout, seed, headless, profile)
     import __main__
     __main__.__dict__['_display'] = display
 
     rules = ClassicGameRules(timeout)
     games = []
+    gameProfiles = []
+    startTime = time.time()
 
     for i in range( numGames ):
         beQuiet = i < numTraining
@@ -643,11 +733,15 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
             gameDisplay = display
             rules.quiet = False
         game = rules.newGame( layout, pacman, ghosts, gameDisplay, beQuiet, catchExceptions)
-        game.run()
+        if headless:
+            game.runHeadless()
+        else:
+            game.run()
         if not beQuiet: games.append(game)
+        gameProfiles.append(game.profiles)
 
         if record:
-            import time, cPickle
+            import cPickle
             fname = ('recorded-game-%d' % (i + 1)) +  '-'.join([str(t) for t in time.localtime()[1:6]])
             f = file(fname, 'w')
             components = {'layout': layout, 'actions': game.moveHistory}
@@ -655,16 +749,104 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
             f.close()
 
     if (numGames-numTraining) > 0:
-        scores = [game.state.getScore() for game in games]
-        wins = [game.state.isWin() for game in games]
-        winRate = wins.count(True)/ float(len(wins))
-        print('Average Score:', sum(scores) / float(len(scores)))
-        print('Scores:       ', ', '.join([str(score) for score in scores]))
-        print(f'Win Rate:      {wins.count(True)}/{len(wins)} ({winRate:.2f})')
-        print('Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins]))
+        printSummary([game.state.getScore() for game in games], [game.state.isWin() for game in games])
+    if headless:
+        printThroughput(numGames, time.time() - startTime)
+    if profile:
+        writeProfile(profile, gameProfiles, time.time() - startTime)
 
     return games
 
+def printSummary( scores, wins ):
+    winRate = wins.count(True)/ float(len(wins))
+    print('Average Score:', sum(scores) / float(len(scores)))
+    print('Scores:       ', ', '.join([str(score) for score in scores]))
+    print(f'Win Rate:      {wins.count(True)}/{len(wins)} ({winRate:.2f})')
+    print('Record:       ', ', '.join([ ['Loss', 'Win'][int(w)] for w in wins]))
+
+def printThroughput( numGames, seconds ):
+    print(f'Played {numGames} games in {seconds:.2f} seconds ({numGames / max(seconds, 1e-9):.1f} games/sec)')
+
+def writeProfile( fileName, gameProfiles, seconds ):
+    """
+    Merges the per-agent profiles of each game, agent by agent, and writes
+    their summaries to fileName as JSON.
+    """
+    import json
+    from game import AgentProfile
+    agents = []
+    for profiles in gameProfiles:
+        for i, profile in enumerate(profiles):
+            if i == len(agents): agents.append(AgentProfile())
+            agents[i].merge(profile)
+    summaries = [dict(index=i, **agent.summary()) for i, agent in enumerate(agents)]
+    with open(fileName, 'w') as f:
+        json.dump({'games': len(gameProfiles), 'seconds': seconds, 'agents': summaries}, f, indent=2)
+    print(f'Wrote agent profile to {fileName}')
+
+_workerSetup = None
+
+def _initWorker( setup ):
+    global _workerSetup
+    _workerSetup = setup
+
+def _playWorkerGame( gameIndex ):
+    """
+    Plays game number gameIndex of a runParallelGames call in a worker process
+    with newly built agents, and returns (gameIndex, score, isWin, profiles).
+    """
+    import textDisplay
+    layout, (pacmanName, agentOpts, ghostName, numGhosts), catchExceptions, timeout, seed, headless = _workerSetup
+    random.seed('%s-%d' % (seed, gameIndex))
+    pacman = loadAgent(pacmanName, True)(**agentOpts)
+    ghostType = loadAgent(ghostName, True)
+    ghosts = [ghostType( i+1 ) for i in range( numGhosts )]
+    rules = ClassicGameRules(timeout)
+    game = rules.newGame( layout, pacman, ghosts, textDisplay.NullGraphics(), True, catchExceptions)
+    if headless:
+        game.runHeadless()
+    else:
+        game.run()
+    return gameIndex, game.state.getScore(), game.state.isWin(), game.profiles
+
+def runParallelGames( layout, agentSpec, numGames, workers, catchExceptions=False, timeout=30, seed='cs188', headless=False, profile=None ):
+    """
+    Plays numGames quiet games on a pool of worker processes, or in this
+    process for a single worker.  agentSpec is (pacmanType, agentArgs,
+    ghostType, numGhosts) naming the agents to build for each game, and game
+    i seeds the random module with seed and i, so a run does not depend on
+    how the games are split between workers.  Prints each game's result as it
+    finishes and returns (score, isWin) pairs in game order; the games
+    themselves stay in the workers.
+    """
+    results = [None] * numGames
+    gameProfiles = [None] * numGames
+    startTime = time.time()
+    setup = (layout, agentSpec, catchExceptions, timeout, seed, headless)
+    if workers == 1:
+        _initWorker(setup)
+        pool = None
+        finished = map(_playWorkerGame, range(numGames))
+    else:
+        import multiprocessing
+        pool = multiprocessing.Pool(workers, _initWorker, (setup,))
+        finished = pool.imap_unordered(_playWorkerGame, range(numGames))
+    try:
+        for gameIndex, score, isWin, profiles in finished:
+            print(f"Game {gameIndex + 1}: {['Loss', 'Win'][int(isWin)]}, Score: {score}")
+            results[gameIndex] = (score, isWin)
+            gameProfiles[gameIndex] = profiles
+    finally:
+        if pool is not None: pool.terminate()
+
+    if numGames > 0:
+        printSummary([score for score, isWin in results], [isWin for score, isWin in results])
+    if headless:
+        printThroughput(numGames, time.time() - startTime)
+    if profile:
+        writeProfile(profile, gameProfiles, time.time() - startTime)
+    return results
+
 if __name__ == '__main__':
     """
     The main function called when pacman.py is run
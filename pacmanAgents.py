@@ -14,7 +14,9 @@
 
 from pacman import Directions
 from game import Agent
+import collections
 import random
+import time
 import game
 import util
 
@@ -50,3 +52,205 @@ class GreedyAgent(Agent):
 
 def scoreEvaluation(state):
     return state.getScore()
+
+def mazeEvaluation(state):
+    """
+    The score, adjusted by how close Pacman is to the nearest food, how much
+    food and how many capsules are left, and where the ghosts are, all
+    measured in maze distance.
+    """
+    if state.isWin() or state.isLose():
+        return state.getScore()
+    distances = state.data.layout.getMazeDistances()
+    position = util.nearestPoint(state.getPacmanPosition())
+
+    value = state.getScore()
+    food = state.getFood().asList()
+    value -= 1.5 * min([distances.getDistance(position, dot) for dot in food])
+    value -= 4 * len(food) + 20 * len(state.getCapsules())
+    for ghostState in state.getGhostStates():
+        distance = distances.getDistance(position, util.nearestPoint(ghostState.getPosition()))
+        if ghostState.scaredTimer > distance:
+            value += 100.0 / (distance + 1)
+        elif distance <= 2:
+            value -= 200.0 / (distance + 1)
+    return value
+
+class SearchTimeout(Exception):
+    "Raised inside AdversarialSearchAgent when a search runs past its deadline"
+    pass
+
+class TranspositionTable:
+    """
+    A bounded map from (GameState, agentIndex) to what a search has learned
+    about that node: (depth, value, bound, bestAction).  When full, the least
+    recently used entry is dropped.
+    """
+    EXACT, LOWER, UPPER = 0, 1, 2
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.entries = collections.OrderedDict()
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+
+class AdversarialSearchAgent(Agent):
+    """
+    Searches the game tree over all agents: Pacman maximizes evalFn, and the
+    ghosts either minimize it (alpha-beta minimax) or move uniformly at random
+    (expectimax).  Depths are counted in plies, one move by every agent.
+
+    The search deepens iteratively from one ply up to depth plies until
+    timeLimit seconds have passed, and plays the best move of the deepest
+    search that finished.  The time limit is capped at TIMEOUT_FRACTION of
+    the game's per-move timeout (see setMoveTimeout), and at an even share of
+    what is left of the game's total time over MOVES_TO_GO more moves (see
+    setMaxTotalTime).  Nodes are cached in a
+    TranspositionTable of tableSize entries, whose best moves are tried first
+    on later visits.  Won and lost games are worth DECIDED_VALUE more or less
+    than evalFn says, and alpha-beta stops deepening once every line is
+    decided.
+    """
+    TIMEOUT_FRACTION = 0.5
+    MOVES_TO_GO = 50
+    DECIDED_VALUE = 1e6 # Added to the value of won games and taken from lost ones
+
+    def __init__(self, evalFn='mazeEvaluation', depth='20', timeLimit='0.2', tableSize='200000', expectimax=False):
+        self.index = 0 # Pacman is always agent index 0
+        self.evaluationFunction = util.lookup(evalFn, globals())
+        self.depth = int(depth)
+        self.timeLimit = float(timeLimit)
+        self.expectimax = bool(int(expectimax))
+        self.table = TranspositionTable(int(tableSize))
+        self.gameDeadline = None
+        self.maxTotalTime = None
+        self.timeUsed = 0.0
+
+    def setMoveTimeout(self, timeout):
+        "Called by the Game with the number of seconds each move is allowed"
+        self.timeLimit = min(self.timeLimit, self.TIMEOUT_FRACTION * timeout)
+
+    def setMaxTotalTime(self, maxTotalTime):
+        "Called by the Game with the number of seconds the agent may use in the whole game"
+        self.maxTotalTime = maxTotalTime
+
+    def setDeadline(self, deadline):
+        "Called by the Game, when it enforces timeouts, with the deadline of the next move"
+        self.gameDeadline = deadline
+
+    def registerInitialState(self, state):
+        start = time.perf_counter()
+        self.table.clear()
+        self.timeUsed = time.perf_counter() - start
+
+    def getAction(self, state):
+        start = time.perf_counter()
+        timeLimit = self.timeLimit
+        if self.gameDeadline is not None:
+            timeLimit = min(timeLimit, self.TIMEOUT_FRACTION * self.gameDeadline.remaining())
+        if self.maxTotalTime is not None:
+            timeLimit = min(timeLimit, (self.maxTotalTime - self.timeUsed) / self.MOVES_TO_GO)
+        self.deadline = util.Deadline(timeLimit)
+        actions = self.orderActions(state, 0, state.getLegalActions(0))
+        bestAction = actions[0] # Played if not even the first ply finishes in time
+        for depth in range(1, self.depth + 1):
+            try:
+                value, action = self.search(state, 0, depth * state.getNumAgents(), -float('inf'), float('inf'))
+            except SearchTimeout:
+                break
+            if action is not None:
+                bestAction = action
+            if not self.expectimax and abs(value) >= self.DECIDED_VALUE / 2:
+                break # Every line ends in a win or a loss, so deeper searches agree
+        self.timeUsed += time.perf_counter() - start
+        return bestAction
+
+    def orderActions(self, state, agentIndex, actions):
+        "Puts the table's best move first and Stop last"
+        entry = self.table.get((state, agentIndex))
+        first = entry[3] if entry is not None else None
+        return sorted(actions, key=lambda action: (action != first, action == Directions.STOP))
+
+    def search(self, state, agentIndex, pliesLeft, alpha, beta):
+        """
+        Returns (value, bestAction) for state with agentIndex to move and
+        pliesLeft single-agent moves to go.
+        """
+        if self.deadline.expired():
+            raise SearchTimeout()
+        if state.isWin():
+            return self.evaluationFunction(state) + self.DECIDED_VALUE, None
+        if state.isLose():
+            return self.evaluationFunction(state) - self.DECIDED_VALUE, None
+        if pliesLeft == 0:
+            return self.evaluationFunction(state), None
+
+        key = (state, agentIndex)
+        entry = self.table.get(key)
+        if entry is not None and entry[0] >= pliesLeft:
+            entryValue, bound = entry[1], entry[2]
+            if bound == TranspositionTable.EXACT: return entryValue, entry[3]
+            if bound == TranspositionTable.LOWER and entryValue >= beta: return entryValue, entry[3]
+            if bound == TranspositionTable.UPPER and entryValue <= alpha: return entryValue, entry[3]
+
+        actions = self.orderActions(state, agentIndex, state.getLegalActions(agentIndex))
+        nextAgent = (agentIndex + 1) % state.getNumAgents()
+        originalAlpha, originalBeta = alpha, beta
+        bestAction = None
+
+        if agentIndex == 0:
+            value = -float('inf')
+            for action in actions:
+                childValue = self.search(state.generateSuccessor(0, action), nextAgent, pliesLeft - 1, alpha, beta)[0]
+                if childValue > value or bestAction is None:
+                    value, bestAction = childValue, action
+                alpha = max(alpha, value)
+                if alpha >= beta: break
+        elif self.expectimax:
+            value = 0.0
+            for action in actions:
+                value += self.search(state.generateSuccessor(agentIndex, action), nextAgent, pliesLeft - 1,
+                                     -float('inf'), float('inf'))[0]
+            value /= len(actions)
+        else:
+            value = float('inf')
+            for action in actions:
+                childValue = self.search(state.generateSuccessor(agentIndex, action), nextAgent, pliesLeft - 1, alpha, beta)[0]
+                if childValue < value or bestAction is None:
+                    value, bestAction = childValue, action
+                beta = min(beta, value)
+                if alpha >= beta: break
+
+        if value <= originalAlpha:
+            bound = TranspositionTable.UPPER
+        elif value >= originalBeta:
+            bound = TranspositionTable.LOWER
+        else:
+            bound = TranspositionTable.EXACT
+        self.table.put(key, (pliesLeft, value, bound, bestAction))
+        return value, bestAction
+
+class AlphaBetaAgent(AdversarialSearchAgent):
+    "Iterative deepening minimax with alpha-beta pruning against adversarial ghosts"
+    def __init__(self, **args):
+        args['expectimax'] = False
+        AdversarialSearchAgent.__init__(self, **args)
+
+class ExpectimaxAgent(AdversarialSearchAgent):
+    "Iterative deepening expectimax against uniformly random ghosts"
+    def __init__(self, **args):
+        args['expectimax'] = True
+        AdversarialSearchAgent.__init__(self, **args)
@@ -17,6 +17,8 @@ In search.py, you will implement generic search algorithms which are called by
 Pacman agents (in searchAgents.py).
 """
 from math import sqrt
+import collections
+import time
 import util
 from game import Directions
 from pprint import pprint
@@ -64,6 +66,106 @@ class SearchProblem:
         util.raiseNotDefined()
 
 
+class SearchStatistics:
+    """
+    What one run of a search function did: the nodes it expanded (states
+    whose successors it asked for) and generated (successors returned), the
+    largest frontier and closed set it held, how often the heuristic was
+    called and for how long, and the wall time of the whole run.
+
+    The search functions below attach one to the problem they are given as
+    problem.searchStatistics.
+    """
+    def __init__(self, problem):
+        self.expanded = 0
+        self.generated = 0
+        self.peakFrontier = 0
+        self.peakClosed = 0
+        self.heuristicCalls = 0
+        self.heuristicTime = 0.0
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.wallTime = 0.0
+        self.startTime = time.perf_counter()
+        problem.searchStatistics = self
+
+    def timeHeuristic(self, heuristic):
+        "Wraps heuristic so that its calls are counted and timed"
+        clock = time.perf_counter
+        def timedHeuristic(state, problem):
+            start = clock()
+            value = heuristic(state, problem)
+            self.heuristicTime += clock() - start
+            self.heuristicCalls += 1
+            return value
+        return timedHeuristic
+
+    def finish(self, path, closedSize):
+        "Records the end of the run and returns path"
+        self.wallTime = time.perf_counter() - self.startTime
+        self.peakClosed = max(self.peakClosed, closedSize)
+        return path
+
+    def asDict(self):
+        return {'expanded': self.expanded, 'generated': self.generated,
+                'peakFrontier': self.peakFrontier, 'peakClosed': self.peakClosed,
+                'heuristicCalls': self.heuristicCalls, 'heuristicTime': self.heuristicTime,
+                'cacheHits': self.cacheHits, 'cacheMisses': self.cacheMisses,
+                'wallTime': self.wallTime}
+
+    def __str__(self):
+        description = ('Expanded %d, generated %d, peak frontier %d, peak closed %d, '
+                       'heuristic calls %d (%.3fs), ' %
+                       (self.expanded, self.generated, self.peakFrontier, self.peakClosed,
+                        self.heuristicCalls, self.heuristicTime))
+        if self.cacheHits or self.cacheMisses:
+            description += 'heuristic cache hits %d, misses %d, ' % (self.cacheHits, self.cacheMisses)
+        return description + 'wall time %.3fs' % self.wallTime
+
+
+class HeuristicCache:
+    """
+    Wraps a heuristic, remembering its value for up to capacity states (by
+    their hash) and forgetting the least recently used one when full.  Only
+    worth it for heuristics that cost more than hashing a state.
+    """
+    def __init__(self, heuristic, capacity):
+        self.heuristic = heuristic
+        self.capacity = capacity
+        self.values = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __call__(self, state, problem):
+        values = self.values
+        value = values.get(state)
+        if value is not None:
+            self.hits += 1
+            values.move_to_end(state)
+            return value
+        self.misses += 1
+        value = values[state] = self.heuristic(state, problem)
+        if len(values) > self.capacity:
+            values.popitem(last=False)
+        return value
+
+
+def reconstructPath(parent_node, state):
+    """
+    Walks a parent map of the form {state: (parentState, action)} back from
+    state to the start state (whose entry is None) and returns the actions
+    in the order they were taken.
+    """
+    moves = []
+    link = parent_node[state]
+    while link is not None:
+        state, action = link
+        moves.append(action)
+        link = parent_node[state]
+    moves.reverse()
+    return moves
+
+
 def tinyMazeSearch(problem):
     """
     Returns a sequence of moves that solves tinyMaze.  For any other maze, the
@@ -100,124 +202,83 @@ def depthFirstSearch(problem):
     print "Start's successors:", problem.getSuccessors(problem.getStartState())
     """
     "*** YOUR CODE HERE ***"
-    # raise Exception("Lmao")
-    print("Start:", problem.getStartState())
-    print("Is the start a goal?", problem.isGoalState(problem.getStartState()))
-    print("Start's successors:", problem.getSuccessors(problem.getStartState()))
-    visited = []
-    solution = util.Stack()
-
-    def dfs_search(problem, current_node, visited, solution: util.Stack):
-        visited.append(current_node[0])
-        if problem.isGoalState(current_node[0]):
-            solution.push(current_node)
-            return 1
-
-        neighbors = problem.getSuccessors(current_node[0])
-
-        if not neighbors:
-            return -1
-
-        solution.push(current_node)
-        for i in neighbors:
-            if i[0] not in visited:
-                status = dfs_search(problem, i, visited, solution)
-                if status == -1:
-                    solution.pop()
-
-                elif status == 1:
-                    return 1
-
-        solution.pop()
-
-    start_state = [problem.getStartState(), '', 0]
-
-    dfs_search(problem, start_state, visited, solution)
-    path = [i[1] for i in solution.list if i[1] != '']
-    # print("Full maze:", visited)
-    # print("Solution:", [i[0] for i in solution.list])
+    stats = SearchStatistics(problem)
+    start = problem.getStartState()
+    if problem.isGoalState(start):
+        return stats.finish([], 0)
+
+    # Explicit stack of (state, remaining successors) pairs in place of
+    # recursion, so deep mazes cannot hit the interpreter's recursion limit.
+    # Successors are walked lazily in the order the problem returns them,
+    # which keeps the expansion order of the recursive formulation.
+    visited = {start}
+    successors = problem.getSuccessors(start)
+    stats.expanded += 1
+    stats.generated += len(successors)
+    stack = [(start, iter(successors))]
+    path = []
+
+    while stack:
+        for successor, action, _ in stack[-1][1]:
+            if successor in visited:
+                continue
+            visited.add(successor)
+            path.append(action)
+            if problem.isGoalState(successor):
+                return stats.finish(path, len(visited))
+            successors = problem.getSuccessors(successor)
+            stats.expanded += 1
+            stats.generated += len(successors)
+            stack.append((successor, iter(successors)))
+            if len(stack) > stats.peakFrontier: stats.peakFrontier = len(stack)
+            break
+        else:
+            # Dead end: backtrack to the previous branching point
+            stack.pop()
+            if path:
+                path.pop()
 
-    return path
+    return stats.finish([], len(visited))
 
 
 def breadthFirstSearch(problem):
     """Search the shallowest nodes in the search tree first."""
     "*** YOUR CODE HERE ***"
-    visited = []
+    stats = SearchStatistics(problem)
+    start = problem.getStartState()
     queue = util.Queue()
-    start_state = (problem.getStartState(), '', 0)
-
-    # visited.append(start_state[0])
-    queue.push(start_state)
+    queue.push(start)
 
-    parent_node = dict()
-    parent_node[start_state] = None
+    # Graph search bookkeeping, all keyed by state so membership tests are O(1)
+    frontier = {start}
+    closed = set()
+    parent_node = {start: None}
 
-    goal_node = None
     while not queue.isEmpty():
-        current_node = queue.pop()
-        visited.append(current_node[0])
-
-        if problem.isGoalState(current_node[0]):
-            goal_node = current_node
-            break
+        state = queue.pop()
+        frontier.discard(state)
+        closed.add(state)
 
-        for i in problem.getSuccessors(current_node[0]):
-            if i[0] not in visited:
-                queue.push(i)
-                parent_node[i] = current_node
+        if problem.isGoalState(state):
+            return stats.finish(reconstructPath(parent_node, state), len(closed))
 
-    thingy = []
-    current_node = goal_node
+        successors = problem.getSuccessors(state)
+        stats.expanded += 1
+        stats.generated += len(successors)
+        for successor, action, _ in successors:
+            if successor not in closed and successor not in frontier:
+                frontier.add(successor)
+                parent_node[successor] = (state, action)
+                queue.push(successor)
+        if len(frontier) > stats.peakFrontier: stats.peakFrontier = len(frontier)
 
-    while current_node is not None:
-        thingy.append(current_node[1])
-        current_node = parent_node[current_node]
-
-    moves = [i for i in thingy[::-1] if i != '']
-    # pprint(moves)
-    return moves
+    return stats.finish([], len(closed))
 
 
 def uniformCostSearch(problem):
     """Search the node of least total cost first."""
     "*** YOUR CODE HERE ***"
-    queue = util.PriorityQueue()
-    start_state = (problem.getStartState(), '', 0)
-
-    queue.push(start_state, 0)
-
-    parent_node = dict()
-    parent_node[start_state] = None
-    cost_to_node = dict()
-    cost_to_node[start_state] = 0
-
-    goal_node = None
-    while not queue.isEmpty():
-        current_node = queue.pop()
-
-        if problem.isGoalState(current_node[0]):
-            goal_node = current_node
-            break
-
-        for i in problem.getSuccessors(current_node[0]):
-            new_cost = cost_to_node[current_node] + i[2]
-            if i not in cost_to_node or new_cost < cost_to_node[i]:
-                cost_to_node[i] = new_cost
-                queue.push(i, new_cost)
-                parent_node[i] = current_node
-
-    thingy = []
-    current_node = goal_node
-    while current_node is not None:
-        thingy.append(current_node)
-        current_node = parent_node[current_node]
-
-    moves = [i[1] for i in thingy[::-1] if i[1] != '']
-    # print(moves)
-
-    return moves
-    # raise Exception("Lmao")
+    return bestFirstSearch(problem, nullHeuristic, util.IndexedPriorityQueue())
 
 
 def nullHeuristic(state, problem=None):
@@ -228,50 +289,244 @@ def nullHeuristic(state, problem=None):
     return 0
 
 
-def aStarSearch(problem, heuristic=nullHeuristic):
-    """Search the node that has the lowest combined cost and heuristic first."""
+def aStarSearch(problem, heuristic=nullHeuristic, heuristicCache=0):
+    """
+    Search the node that has the lowest combined cost and heuristic first.
+
+    With a heuristicCache capacity, heuristic values are memoized in a
+    HeuristicCache of that many states, and its hits and misses are added to
+    the search statistics.
+    """
     "*** YOUR CODE HERE ***"
-    queue = util.PriorityQueue()
-    start_state = (problem.getStartState(), '', 0)
+    if not heuristicCache:
+        return bestFirstSearch(problem, heuristic, util.IndexedPriorityQueue())
+    cache = HeuristicCache(heuristic, int(heuristicCache))
+    path = bestFirstSearch(problem, cache, util.IndexedPriorityQueue())
+    problem.searchStatistics.cacheHits = cache.hits
+    problem.searchStatistics.cacheMisses = cache.misses
+    return path
 
-    # visited.append(start_state[0])
-    queue.push(start_state, 0)
 
-    parent_node = dict()
-    parent_node[start_state] = None
-    cost_to_node = dict()
-    cost_to_node[start_state] = 0
+def bestFirstSearch(problem, heuristic, queue):
+    """
+    Shared core of uniformCostSearch and aStarSearch.  Nodes are ordered by
+    path cost plus heuristic estimate in queue, which must provide push, pop,
+    isEmpty and update(item, priority); util.IndexedPriorityQueue lowers an
+    already queued node's priority in place instead of queueing it again.
+
+    All bookkeeping is keyed by state, so a state reached through different
+    actions is still a single node, and each state is expanded at most once
+    (which is only guaranteed to be optimal for consistent heuristics).
+    """
+    stats = SearchStatistics(problem)
+    heuristic = stats.timeHeuristic(heuristic)
+    start = problem.getStartState()
+    queue.update(start, heuristic(start, problem))
+
+    parent_node = {start: None}
+    cost_to_node = {start: 0}
+    closed = set()
 
-    goal_node = None
     while not queue.isEmpty():
-        current_node = queue.pop()
+        state = queue.pop()
+        if state in closed:
+            # A leftover duplicate from a queue without decrease-key
+            continue
+
+        if problem.isGoalState(state):
+            return stats.finish(reconstructPath(parent_node, state), len(closed))
+        closed.add(state)
+
+        cost = cost_to_node[state]
+        successors = problem.getSuccessors(state)
+        stats.expanded += 1
+        stats.generated += len(successors)
+        for successor, action, stepCost in successors:
+            if successor in closed:
+                continue
+            new_cost = cost + stepCost
+            if successor not in cost_to_node or new_cost < cost_to_node[successor]:
+                cost_to_node[successor] = new_cost
+                parent_node[successor] = (state, action)
+                queue.update(successor, new_cost + heuristic(successor, problem))
+        # Every discovered state that is not closed is on the frontier
+        frontierSize = len(cost_to_node) - len(closed)
+        if frontierSize > stats.peakFrontier: stats.peakFrontier = frontierSize
+
+    return stats.finish([], len(closed))
+
+
+class ReversedProblem(SearchProblem):
+    """
+    A problem with a single goal state, run backwards: it starts at the goal,
+    its goal is the original start, and its successors are the original
+    predecessors.  The problem must provide getGoalState and getPredecessors
+    (see PositionSearchProblem).  Everything else, such as walls, is looked
+    up on the original problem, and goal is the original start, so
+    heuristics written for the original problem estimate distances back to
+    the start.
+    """
+    def __init__(self, problem):
+        self.problem = problem
+        self.start = problem.getGoalState()
+        self.goal = problem.getStartState()
 
-        if problem.isGoalState(current_node[0]):
-            goal_node = current_node
-            break
+    def __getattr__(self, name):
+        return getattr(self.problem, name)
 
-        for i in problem.getSuccessors(current_node[0]):
-            new_cost = cost_to_node[current_node] + i[2]
-            if i not in cost_to_node or new_cost < cost_to_node[i]:
-                cost_to_node[i] = new_cost
-                queue.push(i, new_cost + heuristic(i[0], problem))
-                parent_node[i] = current_node
+    def getStartState(self):
+        return self.start
+
+    def getGoalState(self):
+        return self.goal
+
+    def isGoalState(self, state):
+        return state == self.goal
 
-    thingy = []
-    current_node = goal_node
-    while current_node is not None:
-        thingy.append(current_node)
-        current_node = parent_node[current_node]
+    def getSuccessors(self, state):
+        return self.problem.getPredecessors(state)
+
+    def getPredecessors(self, state):
+        return self.problem.getSuccessors(state)
 
-    moves = [i[1] for i in thingy[::-1] if i[1] != '']
-    # print(moves)
 
+def joinPaths(forwardParents, backwardParents, state):
+    """
+    Returns the actions from the start to state in a forward parent map,
+    followed by those from state to the goal in a backward one, where
+    backwardParents[state] is (nextState, action) with action leading from
+    state to nextState.
+    """
+    moves = reconstructPath(forwardParents, state)
+    link = backwardParents[state]
+    while link is not None:
+        state, action = link
+        moves.append(action)
+        link = backwardParents[state]
     return moves
 
 
+def bidirectionalBreadthFirstSearch(problem):
+    """
+    Breadth first search from the start and backwards from the goal at once,
+    for problems that provide getGoalState and getPredecessors.  Whichever
+    side has the smaller frontier grows by a whole layer at a time, and the
+    first state reached from both sides lies on a shortest path: the nodes
+    within the depths searched so far did not meet, so no path is shorter.
+    """
+    stats = SearchStatistics(problem)
+    reverse = ReversedProblem(problem)
+    start = problem.getStartState()
+    if problem.isGoalState(start):
+        return stats.finish([], 0)
+
+    forwardParents, backwardParents = {start: None}, {reverse.getStartState(): None}
+    forwardLayer, backwardLayer = [start], [reverse.getStartState()]
+    while forwardLayer and backwardLayer:
+        if len(forwardLayer) <= len(backwardLayer):
+            layer, parents, otherParents, expand = forwardLayer, forwardParents, backwardParents, problem.getSuccessors
+        else:
+            layer, parents, otherParents, expand = backwardLayer, backwardParents, forwardParents, reverse.getSuccessors
+        nextLayer = []
+        for state in layer:
+            successors = expand(state)
+            stats.expanded += 1
+            stats.generated += len(successors)
+            for successor, action, _ in successors:
+                if successor in parents:
+                    continue
+                parents[successor] = (state, action)
+                if successor in otherParents:
+                    closedSize = len(forwardParents) + len(backwardParents)
+                    return stats.finish(joinPaths(forwardParents, backwardParents, successor), closedSize)
+                nextLayer.append(successor)
+        if parents is forwardParents:
+            forwardLayer = nextLayer
+        else:
+            backwardLayer = nextLayer
+        frontierSize = len(forwardLayer) + len(backwardLayer)
+        if frontierSize > stats.peakFrontier: stats.peakFrontier = frontierSize
+
+    return stats.finish([], len(forwardParents) + len(backwardParents))
+
+
+def bidirectionalAStarSearch(problem, heuristic=nullHeuristic):
+    """
+    A* from the start and backwards from the goal at once, for problems that
+    provide getGoalState and getPredecessors, expanding from whichever side
+    has the smaller frontier.
+
+    Both sides order nodes by path cost plus a shared potential: half the
+    difference between the heuristic to the goal and the heuristic back to
+    the start (the forward side adds it, the backward side subtracts it).
+    With a consistent heuristic this is consistent in both directions, so
+    once the smallest keys of the two sides add up to at least the cost of
+    the best path found through a state reached from both sides, that path
+    is optimal.
+    """
+    stats = SearchStatistics(problem)
+    heuristic = stats.timeHeuristic(heuristic)
+    reverse = ReversedProblem(problem)
+    start, goal = problem.getStartState(), reverse.getStartState()
+    if problem.isGoalState(start):
+        return stats.finish([], 0)
+
+    potentials = {}
+    def potential(state):
+        value = potentials.get(state)
+        if value is None:
+            value = potentials[state] = (heuristic(state, problem) - heuristic(state, reverse)) / 2.0
+        return value
+
+    # Each side is (queue, cost to node, parent map, closed set, successor function, sign of potential)
+    sides = []
+    for origin, expand, sign in ((start, problem.getSuccessors, 1), (goal, reverse.getSuccessors, -1)):
+        queue = util.IndexedPriorityQueue()
+        queue.push(origin, sign * potential(origin))
+        sides.append((queue, {origin: 0}, {origin: None}, set(), expand, sign))
+    forward, backward = sides
+
+    best, meeting = float('inf'), None
+    while not forward[0].isEmpty() and not backward[0].isEmpty():
+        if forward[0].peekPriority() + backward[0].peekPriority() >= best:
+            break
+        if len(forward[1]) - len(forward[3]) <= len(backward[1]) - len(backward[3]):
+            side, other = forward, backward
+        else:
+            side, other = backward, forward
+        queue, cost_to_node, parent_node, closed, expand, sign = side
+        otherCosts = other[1]
+
+        state = queue.pop()
+        closed.add(state)
+        cost = cost_to_node[state]
+        successors = expand(state)
+        stats.expanded += 1
+        stats.generated += len(successors)
+        for successor, action, stepCost in successors:
+            if successor in closed:
+                continue
+            new_cost = cost + stepCost
+            if successor not in cost_to_node or new_cost < cost_to_node[successor]:
+                cost_to_node[successor] = new_cost
+                parent_node[successor] = (state, action)
+                queue.update(successor, new_cost + sign * potential(successor))
+                if successor in otherCosts and new_cost + otherCosts[successor] < best:
+                    best, meeting = new_cost + otherCosts[successor], successor
+        frontierSize = len(forward[1]) - len(forward[3]) + len(backward[1]) - len(backward[3])
+        if frontierSize > stats.peakFrontier: stats.peakFrontier = frontierSize
+
+    closedSize = len(forward[3]) + len(backward[3])
+    if meeting is None:
+        return stats.finish([], closedSize)
+    return stats.finish(joinPaths(forward[2], backward[2], meeting), closedSize)
+
+
 # Abbreviations
 bfs = breadthFirstSearch
 dfs = depthFirstSearch
 astar = aStarSearch
 ucs = uniformCostSearch
 tms = tinyMazeSearch
+bibfs = bidirectionalBreadthFirstSearch
+biastar = bidirectionalAStarSearch
@@ -37,6 +37,7 @@ Good luck and happy searching!
 from game import Directions
 from game import Agent
 from game import Actions
+from game import Grid
 import util
 import time
 import search
@@ -69,12 +70,18 @@ class SearchAgent(Agent):
       depthFirstSearch or dfs
       breadthFirstSearch or bfs
 
+    If statsFile is given, the search statistics of every search the agent
+    runs are appended to it as a line of JSON.  A heuristicCache capacity
+    makes aStarSearch memoize up to that many heuristic values.
 
     Note: You should NOT change any code in SearchAgent
     """
+    fn, heuristic, statsFile = None, None, None
 
-    def __init__(self, fn='dfs', prob='PositionSearchProblem', heuristic='nullHeuristic'):
+    def __init__(self, fn='dfs', prob='PositionSearchProblem', heuristic='nullHeuristic', statsFile=None,
+                 heuristicCache='0'):
         # Warning: some advanced Python magic is employed below to find the right functions and problems
+        self.fn, self.statsFile = fn, statsFile
 
         # Get the search function from the name and heuristic
         if fn not in dir(search):
@@ -91,8 +98,16 @@ class SearchAgent(Agent):
             else:
                 raise AttributeError(heuristic + ' is not a function in searchAgents.py or search.py.')
             print('[SearchAgent] using function %s and heuristic %s' % (fn, heuristic))
+            self.heuristic = heuristic
             # Note: this bit of Python trickery combines the search algorithm and the heuristic
-            self.searchFunction = lambda x: func(x, heuristic=heur)
+            cacheSize = int(heuristicCache)
+            if not cacheSize:
+                self.searchFunction = lambda x: func(x, heuristic=heur)
+            elif 'heuristicCache' in func.__code__.co_varnames:
+                print('[SearchAgent] caching up to %d heuristic values' % cacheSize)
+                self.searchFunction = lambda x: func(x, heuristic=heur, heuristicCache=cacheSize)
+            else:
+                raise AttributeError(fn + ' does not support a heuristic cache.')
 
         # Get the search problem type from the name
         if prob not in globals().keys() or not prob.endswith('Problem'):
@@ -116,6 +131,21 @@ class SearchAgent(Agent):
         totalCost = problem.getCostOfActions(self.actions)
         print('Path found with total cost of %d in %.1f seconds' % (totalCost, time.time() - starttime))
         if '_expanded' in dir(problem): print('Search nodes expanded: %d' % problem._expanded)
+        if 'searchStatistics' in dir(problem):
+            print('Search statistics: %s' % problem.searchStatistics)
+            if self.statsFile: self.writeStatistics(problem, totalCost)
+
+    def writeStatistics(self, problem, totalCost):
+        "Appends the statistics of the search just run to statsFile as JSON"
+        import json
+        walls = problem.walls if 'walls' in dir(problem) else None
+        record = {'agent': self.__class__.__name__, 'fn': self.fn, 'heuristic': self.heuristic,
+                  'problem': problem.__class__.__name__,
+                  'layoutSize': [walls.width, walls.height] if walls else None,
+                  'cost': totalCost, 'pathLength': len(self.actions)}
+        record.update(problem.searchStatistics.asDict())
+        with open(self.statsFile, 'a') as f:
+            f.write(json.dumps(record) + '\n')
 
     def getAction(self, state):
         """
@@ -153,6 +183,7 @@ class PositionSearchProblem(search.SearchProblem):
         goal: A position in the gameState
         """
         self.walls = gameState.getWalls()
+        self.successorTable = Actions.getSuccessorTable(self.walls)
         self.startState = gameState.getPacmanPosition()
         if start != None: self.startState = start
         self.goal = goal
@@ -192,15 +223,8 @@ class PositionSearchProblem(search.SearchProblem):
          cost of expanding to that successor
         """
 
-        successors = []
-        for action in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
-            x,y = state
-            dx, dy = Actions.directionToVector(action)
-            nextx, nexty = int(x + dx), int(y + dy)
-            if not self.walls[nextx][nexty]:
-                nextState = (nextx, nexty)
-                cost = self.costFn(nextState)
-                successors.append( ( nextState, action, cost) )
+        costFn = self.costFn
+        successors = [(nextState, action, costFn(nextState)) for nextState, action in self.successorTable[state]]
 
         # Bookkeeping for display purposes
         self._expanded += 1 # DO NOT CHANGE
@@ -210,6 +234,26 @@ class PositionSearchProblem(search.SearchProblem):
 
         return successors
 
+    def getGoalState(self):
+        return self.goal
+
+    def getPredecessors(self, state):
+        """
+        Returns the states that lead to state, with the actions that lead from
+        them to it and their costs, as (predecessor, action, stepCost)
+        triples.  Used to search backwards from the goal.
+        """
+        cost = self.costFn(state)
+        predecessors = [(previous, Directions.REVERSE[action], cost) for previous, action in self.successorTable[state]]
+
+        # Bookkeeping for display purposes
+        self._expanded += 1 # DO NOT CHANGE
+        if state not in self._visited:
+            self._visited[state] = True
+            self._visitedlist.append(state)
+
+        return predecessors
+
     def getCostOfActions(self, actions):
         """
         Returns the cost of a particular sequence of actions. If those actions
@@ -222,7 +266,7 @@ class PositionSearchProblem(search.SearchProblem):
             # Check figure out the next state and see whether its' legal
             dx, dy = Actions.directionToVector(action)
             x, y = int(x + dx), int(y + dy)
-            if self.walls[x][y]: return 999999
+            if self.walls.get(x, y): return 999999
             cost += self.costFn((x,y))
         return cost
 
@@ -271,6 +315,11 @@ class CornersProblem(search.SearchProblem):
     This search problem finds paths through all four corners of a layout.
 
     You must select a suitable state space and successor function
+
+    A search state is a tuple ( positionIndex, cornerMask ) where
+      positionIndex: the cell Pacman is in, numbered x * height + y as in Grid
+      cornerMask:    an int with bit i set if problem.corners[i] has not
+                     been visited yet
     """
 
     def __init__(self, startingGameState):
@@ -278,6 +327,7 @@ class CornersProblem(search.SearchProblem):
         Stores the walls, pacman's starting position and corners.
         """
         self.walls = startingGameState.getWalls()
+        self.height = self.walls.height
         self.startingPosition = startingGameState.getPacmanPosition()
         top, right = self.walls.height-2, self.walls.width-2
         self.corners = ((1,1), (1,top), (right, 1), (right, top))
@@ -288,6 +338,31 @@ class CornersProblem(search.SearchProblem):
         # Please add any code here which you would like to use
         # in initializing the problem
         "*** YOUR CODE HERE ***"
+        self.cornerBits = dict((corner, 1 << i) for i, corner in enumerate(self.corners))
+        self.successorTable = Actions.getIndexedSuccessorTable(self.walls, self.cornerBits)
+        x, y = self.startingPosition
+        allCorners = sum(set(self.cornerBits.values()))
+        self.start = (x * self.height + y, allCorners & ~self.cornerBits.get(self.startingPosition, 0))
+
+        # For cornersHeuristic: the maze distance from every open cell (by
+        # index) to each corner, and tourCosts[i][mask], the length of the
+        # shortest walk from corner i through all the corners in mask.  Wall
+        # corners are infinitely far from everything.
+        distances = startingGameState.data.layout.getMazeDistances()
+        cornerRows = [distances.getRow(distances.cellIndex[corner]) if corner in distances.cellIndex else None
+                      for corner in self.corners]
+        self.cornerDistances = [None] * (self.walls.width * self.height)
+        for (x, y), cellNumber in distances.cellIndex.items():
+            self.cornerDistances[x * self.height + y] = tuple(
+                float('inf') if row is None or row[cellNumber] == distances.unreachable else row[cellNumber]
+                for row in cornerRows)
+        self.tourCosts = [[0] * 16 for corner in self.corners]
+        for mask in range(1, 16): # Every proper subset of mask comes before it
+            for i, (x, y) in enumerate(self.corners):
+                if mask & (1 << i): continue
+                fromCorner = self.cornerDistances[x * self.height + y] or (float('inf'),) * 4
+                self.tourCosts[i][mask] = min([fromCorner[j] + self.tourCosts[j][mask & ~(1 << j)]
+                                               for j in range(4) if mask & (1 << j)])
 
     def getStartState(self):
         """
@@ -296,16 +371,20 @@ class CornersProblem(search.SearchProblem):
         """
         "*** YOUR CODE HERE ***"
         # util.raiseNotDefined()
-        return (self.startingPosition, self.corners)
+        return self.start
 
     def isGoalState(self, state):
         """
         Returns whether this search state is a goal state of the problem.
         """
         "*** YOUR CODE HERE ***"
-        return (state[0],) == state[1]
+        return state[1] == 0
         # util.raiseNotDefined()
 
+    def getPosition(self, state):
+        "Returns Pacman's (x, y) position in a search state"
+        return divmod(state[0], self.height)
+
     def getSuccessors(self, state):
         """
         Returns successor states, the actions they require, and a cost of 1.
@@ -317,32 +396,10 @@ class CornersProblem(search.SearchProblem):
             is the incremental cost of expanding to that successor
         """
 
-        successors = []
-        pos = state[0]
-        remaining_corners = state[1]
-        # print(f"{pos = } | {remaining_corners = }")
-
-        for action in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
-            # Add a successor state to the successor list if the action is legal
-            # Here's a code snippet for figuring out whether a new position hits a wall:
-            #   x,y = currentPosition
-            #   dx, dy = Actions.directionToVector(action)
-            #   nextx, nexty = int(x + dx), int(y + dy)
-            #   hitsWall = self.walls[nextx][nexty]
-            x, y = pos
-            dx, dy = Actions.directionToVector(action)
-            nextx, nexty = int(x + dx), int(y + dy)
-            hitsWall = self.walls[nextx][nexty]
-
-            if hitsWall:
-                continue
-
-            coords = (nextx, nexty)
-            new_remaining_corners = tuple(i for i in remaining_corners if i != pos)
-
-            state_thingy = (coords, new_remaining_corners)
-            successors.append((state_thingy, action, 1))
-            "*** YOUR CODE HERE ***"
+        "*** YOUR CODE HERE ***"
+        cornerMask = state[1]
+        successors = [((nextIndex, cornerMask & ~cornerBit), action, 1)
+                      for (nextIndex, cornerBit), action in self.successorTable[state[0]]]
 
         self._expanded += 1 # DO NOT CHANGE
         return successors
@@ -357,23 +414,10 @@ class CornersProblem(search.SearchProblem):
         for action in actions:
             dx, dy = Actions.directionToVector(action)
             x, y = int(x + dx), int(y + dy)
-            if self.walls[x][y]: return 999999
+            if self.walls.get(x, y): return 999999
         return len(actions)
 
 
-def manhattanCorners(pos, corners):
-    lowest = 999999
-    closest_corner = None
-
-    for i in corners:
-        dist = abs(pos[0] - i[0]) + abs(pos[1] - i[1])
-        if dist < lowest:
-            closest_corner = i
-            lowest = dist
-
-    return lowest, closest_corner
-
-
 def cornersHeuristic(state, problem):
     """
     A heuristic for the CornersProblem that you defined.
@@ -390,19 +434,14 @@ def cornersHeuristic(state, problem):
     corners = problem.corners # These are the corner coordinates
     walls = problem.walls # These are the walls of the maze, as a Grid (game.py)
 
-    pos = state[0]
-    remaining_corners = list(state[1])
-    heuristic = 0
-
-    while remaining_corners:
-        current_heuristic, closest_corner = manhattanCorners(pos, remaining_corners)
-        heuristic += current_heuristic
-        pos = closest_corner
-        remaining_corners.remove(closest_corner)
-
-    return heuristic
     "*** YOUR CODE HERE ***"
-    return 0 # Default to trivial solution
+    mask = state[1]
+    if mask == 0: return 0
+
+    # The exact cost of visiting the remaining corners: walk to the first
+    # corner of the best order, then follow the shortest tour through the rest
+    toCorners, tourCosts = problem.cornerDistances[state[0]], problem.tourCosts
+    return min([toCorners[i] + tourCosts[i][mask & ~(1 << i)] for i in range(4) if mask & (1 << i)])
 
 class AStarCornersAgent(SearchAgent):
     "A SearchAgent for FoodSearchProblem using A* and your foodHeuristic"
@@ -415,47 +454,77 @@ class FoodSearchProblem:
     A search problem associated with finding the a path that collects all of the
     food (dots) in a Pacman game.
 
-    A search state in this problem is a tuple ( pacmanPosition, foodGrid ) where
-      pacmanPosition: a tuple (x,y) of integers specifying Pacman's position
-      foodGrid:       a Grid (see game.py) of either True or False, specifying remaining food
+    A search state in this problem is a tuple ( positionIndex, foodMask ) where
+      positionIndex: the cell Pacman is in, numbered x * height + y as in Grid
+      foodMask:      an int with bit i set if the i-th starting food dot
+                     (problem.foodList[i]) has not been eaten yet
+
+    Use getPosition, getFoodGrid / getFoodList and encodeState to convert
+    between this and the ( pacmanPosition, foodGrid ) form.
     """
     def __init__(self, startingGameState):
-        self.start = (startingGameState.getPacmanPosition(), startingGameState.getFood())
         self.walls = startingGameState.getWalls()
         self.startingGameState = startingGameState
+        self.height = self.walls.height
+        self.startPosition = startingGameState.getPacmanPosition()
+        self.foodList = startingGameState.getFood().asList()
+        self.foodBits = dict((cell, 1 << i) for i, cell in enumerate(self.foodList))
+        self.successorTable = Actions.getIndexedSuccessorTable(self.walls, self.foodBits)
+        self.start = self.encodeState(self.startPosition, startingGameState.getFood())
         self._expanded = 0 # DO NOT CHANGE
         self.heuristicInfo = {} # A dictionary for the heuristic to store information
 
+    def encodeState(self, position, foodGrid):
+        "Returns the search state for Pacman at position with the food in foodGrid left"
+        x, y = position
+        foodMask = 0
+        for cell in foodGrid.asList():
+            foodMask |= self.foodBits[cell]
+        return (x * self.height + y, foodMask)
+
+    def getPosition(self, state):
+        "Returns Pacman's (x, y) position in a search state"
+        return divmod(state[0], self.height)
+
+    def getFoodList(self, state):
+        "Returns the positions of the food left in a search state"
+        foodMask, foodList = state[1], []
+        while foodMask:
+            lowest = foodMask & -foodMask
+            foodList.append(self.foodList[lowest.bit_length() - 1])
+            foodMask ^= lowest
+        return foodList
+
+    def getFoodGrid(self, state):
+        "Returns the food left in a search state as a Grid"
+        foodGrid = Grid(self.walls.width, self.walls.height)
+        for x, y in self.getFoodList(state):
+            foodGrid[x][y] = True
+        return foodGrid
+
     def getStartState(self):
         return self.start
 
     def isGoalState(self, state):
-        return state[1].count() == 0
+        return state[1] == 0
 
     def getSuccessors(self, state):
         "Returns successor states, the actions they require, and a cost of 1."
-        successors = []
         self._expanded += 1 # DO NOT CHANGE
-        for direction in [Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST]:
-            x,y = state[0]
-            dx, dy = Actions.directionToVector(direction)
-            nextx, nexty = int(x + dx), int(y + dy)
-            if not self.walls[nextx][nexty]:
-                nextFood = state[1].copy()
-                nextFood[nextx][nexty] = False
-                successors.append( ( ((nextx, nexty), nextFood), direction, 1) )
-        return successors
+        foodMask = state[1]
+        return [((nextIndex, foodMask & ~foodBit), direction, 1)
+                for (nextIndex, foodBit), direction in self.successorTable[state[0]]]
 
     def getCostOfActions(self, actions):
         """Returns the cost of a particular sequence of actions.  If those actions
         include an illegal move, return 999999"""
-        x,y= self.getStartState()[0]
+        x,y= self.startPosition
         cost = 0
         for action in actions:
             # figure out the next state and see whether it's legal
             dx, dy = Actions.directionToVector(action)
             x, y = int(x + dx), int(y + dy)
-            if self.walls[x][y]:
+            if self.walls.get(x, y):
                 return 999999
             cost += 1
         return cost
@@ -479,9 +548,11 @@ def foodHeuristic(state, problem):
     other hand, inadmissible or inconsistent heuristics may find optimal
     solutions, so be careful.
 
-    The state is a tuple ( pacmanPosition, foodGrid ) where foodGrid is a Grid
-    (see game.py) of either True or False. You can call foodGrid.asList() to get
-    a list of food coordinates instead.
+    The state is a tuple ( positionIndex, foodMask ) (see FoodSearchProblem).
+    problem.getPosition(state) gives Pacman's (x, y) position,
+    problem.getFoodList(state) the coordinates of the remaining food and
+    problem.getFoodGrid(state) the same as a Grid (see game.py) of either True
+    or False.
 
     If you want access to info like walls, capsules, etc., you can query the
     problem.  For example, problem.walls gives you a Grid of where the walls
@@ -494,13 +565,69 @@ def foodHeuristic(state, problem):
     Subsequent calls to this heuristic can access
     problem.heuristicInfo['wallCount']
     """
-    position, foodGrid = state
+    position = problem.getPosition(state)
     "*** YOUR CODE HERE ***"
 
-    foodList = foodGrid.asList()
-    maze_dist = [mazeDistance(i, position, problem.startingGameState) for i in foodList]
-
-    return max(maze_dist) if maze_dist else 0
+    # Any path that eats all the food first walks to some dot and then
+    # visits the others, which costs at least the distance to the nearest dot
+    # plus the weight of a minimum spanning tree over the dots (in maze
+    # distance).  Eating a dot lowers the tree weight by at most the step
+    # that ate it, so the estimate is consistent as well.
+    foodMask = state[1]
+    if foodMask == 0: return 0
+    info = problem.heuristicInfo
+    if 'foodDistances' not in info:
+        initializeFoodDistances(problem)
+    toFood = info['foodDistances'][state[0]]
+    mstWeights = info['mstWeights']
+
+    foodIndices = []
+    nearest = float('inf')
+    while foodMask:
+        lowest = foodMask & -foodMask
+        i = lowest.bit_length() - 1
+        foodIndices.append(i)
+        if toFood[i] < nearest: nearest = toFood[i]
+        foodMask ^= lowest
+
+    # Sibling states mostly share their remaining food, so trees are kept
+    # per food mask
+    weight = mstWeights.get(state[1])
+    if weight is None:
+        weight = mstWeights[state[1]] = minimumSpanningTreeWeight(foodIndices, info['foodToFood'])
+    return nearest + weight
+
+def initializeFoodDistances(problem):
+    """
+    Stores in problem.heuristicInfo the maze distances from every cell (by
+    FoodSearchProblem cell index) to each starting food dot, between the
+    dots, and an empty table of spanning tree weights by food mask.
+    """
+    distances = problem.startingGameState.data.layout.getMazeDistances()
+    walls, height = problem.walls, problem.height
+    foodRows = [distances.getRow(distances.cellIndex[dot]) for dot in problem.foodList]
+    foodDistances = [None] * (walls.width * height)
+    for cell, cellNumber in distances.cellIndex.items():
+        row = [foodRow[cellNumber] for foodRow in foodRows]
+        foodDistances[cell[0] * height + cell[1]] = [float('inf') if d == distances.unreachable else d for d in row]
+    info = problem.heuristicInfo
+    info['foodDistances'] = foodDistances
+    info['foodToFood'] = [foodDistances[x * height + y] for x, y in problem.foodList]
+    info['mstWeights'] = {}
+
+def minimumSpanningTreeWeight(nodes, distance):
+    "Prim's algorithm over the given nodes with distance[i][j] edge weights"
+    if not nodes: return 0
+    first, rest = nodes[0], nodes[1:]
+    best = dict((node, distance[first][node]) for node in rest)
+    weight = 0
+    while best:
+        node = min(best, key=best.get)
+        weight += best.pop(node)
+        row = distance[node]
+        for other in best:
+            if row[other] < best[other]: best[other] = row[other]
+    return weight
 
 class ClosestDotSearchAgent(SearchAgent):
     "Search for all food using a sequence of searches"
@@ -556,6 +683,7 @@ class AnyFoodSearchProblem(PositionSearchProblem):
 
         # Store info for the PositionSearchProblem (no need to change this)
         self.walls = gameState.getWalls()
+        self.successorTable = Actions.getSuccessorTable(self.walls)
         self.startState = gameState.getPacmanPosition()
         self.costFn = lambda x: 1
         self._visited, self._visitedlist, self._expanded = {}, [], 0 # DO NOT CHANGE
@@ -568,13 +696,13 @@ class AnyFoodSearchProblem(PositionSearchProblem):
         x,y = state
 
         "*** YOUR CODE HERE ***"
-        return self.food[x][y]
+        return self.food.get(x, y)
 
 def mazeDistance(point1, point2, gameState):
     """
-    Returns the maze distance between any two points, using the search functions
-    you have already built. The gameState can be any game state -- Pacman's
-    position in that state is ignored.
+    Returns the maze distance between any two points, using the distance
+    table the layout precomputes (see layout.MazeDistances). The gameState can
+    be any game state -- Pacman's position in that state is ignored.
 
     Example usage: mazeDistance( (2,4), (5,6), gameState)
 
@@ -585,5 +713,4 @@ def mazeDistance(point1, point2, gameState):
     walls = gameState.getWalls()
     assert not walls[x1][y1], 'point1 is a wall: ' + str(point1)
     assert not walls[x2][y2], 'point2 is a wall: ' + str(point2)
-    prob = PositionSearchProblem(gameState, start=point1, goal=point2, warn=False, visualize=False)
-    return len(search.bfs(prob))
+    return gameState.data.layout.getMazeDistances().getDistance(point1, point2)
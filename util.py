@@ -30,6 +30,7 @@ import sys
 import inspect
 import heapq, random
 import io
+import collections
 
 
 class FixedRandom:
@@ -151,11 +152,11 @@ class Stack:
 class Queue:
     "A container with a first-in-first-out (FIFO) queuing policy."
     def __init__(self):
-        self.list = []
+        self.list = collections.deque()
 
     def push(self,item):
         "Enqueue the 'item' into the queue"
-        self.list.insert(0,item)
+        self.list.appendleft(item)
 
     def pop(self):
         """
@@ -206,6 +207,93 @@ class PriorityQueue:
         else:
             self.push(item, priority)
 
+class IndexedPriorityQueue:
+    """
+      A priority queue that also keeps an index from each item to the
+      position of its entry in the heap.  This lets update lower the
+      priority of a queued item in place in O(log n) (decrease-key), so the
+      heap never holds more than one entry per item and there are no stale
+      duplicates to skip over when popping.  Items must be hashable.
+
+      Ties are broken by insertion order, as in PriorityQueue.
+    """
+    def  __init__(self):
+        self.heap = []    # entries are [priority, count, item]
+        self.index = {}   # item -> position of its entry in self.heap
+        self.count = 0
+
+    def push(self, item, priority):
+        "Adds an item that is not already in the queue"
+        entry = [priority, self.count, item]
+        self.count += 1
+        self.index[item] = len(self.heap)
+        self.heap.append(entry)
+        self._siftUp(len(self.heap) - 1)
+
+    def pop(self):
+        "Removes and returns the lowest-priority item"
+        heap = self.heap
+        top = heap[0]
+        last = heap.pop()
+        if heap:
+            heap[0] = last
+            self.index[last[2]] = 0
+            self._siftDown(0)
+        del self.index[top[2]]
+        return top[2]
+
+    def isEmpty(self):
+        return len(self.heap) == 0
+
+    def peekPriority(self):
+        "Returns the lowest priority in the queue without removing its item"
+        return self.heap[0][0]
+
+    def __contains__(self, item):
+        return item in self.index
+
+    def update(self, item, priority):
+        # If item already in priority queue with higher priority, lower it in place.
+        # If item already in priority queue with equal or lower priority, do nothing.
+        # If item not in priority queue, do the same thing as self.push.
+        position = self.index.get(item)
+        if position is None:
+            self.push(item, priority)
+        elif priority < self.heap[position][0]:
+            self.heap[position][0] = priority
+            self._siftUp(position)
+
+    def _siftUp(self, position):
+        heap, index = self.heap, self.index
+        entry = heap[position]
+        while position > 0:
+            parentPosition = (position - 1) >> 1
+            parent = heap[parentPosition]
+            if not entry < parent:
+                break
+            heap[position] = parent
+            index[parent[2]] = position
+            position = parentPosition
+        heap[position] = entry
+        index[entry[2]] = position
+
+    def _siftDown(self, position):
+        heap, index = self.heap, self.index
+        size = len(heap)
+        entry = heap[position]
+        child = 2 * position + 1
+        while child < size:
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child += 1
+            if not heap[child] < entry:
+                break
+            heap[position] = heap[child]
+            index[heap[position][2]] = position
+            position = child
+            child = 2 * position + 1
+        heap[position] = entry
+        index[entry[2]] = position
+
 class PriorityQueueWithFunction(PriorityQueue):
     """
     Implements a priority queue with the same push/pop signature of the
@@ -602,19 +690,115 @@ def pause():
 # code to handle timeouts
 #
 # FIXME
-# NOTE: TimeoutFuncton is NOT reentrant.  Later timeouts will silently
-# disable earlier timeouts.  Could be solved by maintaining a global list
-# of active time outs.  Currently, questions which have test cases calling
-# this have all student code so wrapped.
+# NOTE: TimeoutFuncton is NOT reentrant on the main thread.  Later timeouts
+# will silently disable earlier timeouts.  Could be solved by maintaining a
+# global list of active time outs.  Currently, questions which have test
+# cases calling this have all student code so wrapped.
 #
+import itertools
+import queue
 import signal
 import time
+import threading
+try:
+    import ctypes
+    _setAsyncExc = ctypes.pythonapi.PyThreadState_SetAsyncExc
+except (ImportError, AttributeError): # Not CPython
+    _setAsyncExc = None
+
 class TimeoutFunctionException(Exception):
     """Exception to raise on a timeout"""
     pass
 
+class Deadline:
+    """
+    A moment a given number of seconds from now, on the monotonic clock.
+    Agents that are handed one can poll it cheaply to budget their search.
+    """
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expiresAt = time.monotonic() + seconds
+
+    def remaining(self):
+        "Seconds left before the deadline, or 0 if it has passed"
+        return max(0.0, self.expiresAt - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expiresAt
+
+    def check(self):
+        "Raises TimeoutFunctionException if the deadline has passed"
+        if time.monotonic() >= self.expiresAt:
+            raise TimeoutFunctionException()
+
+class _Watchdog:
+    """
+    A daemon thread that raises TimeoutFunctionException inside threads whose
+    TimeoutFunction call outlives its deadline.  The exception is delivered
+    between bytecodes, so a thread blocked in C code is only stopped when it
+    returns to Python.
+
+    Since the exception can arrive at any point, callers never take a lock:
+    they hand the watchdog a watch through a SimpleQueue, and whichever side
+    first pops the watch's claim token decides whether the call timed out.
+    """
+    def __init__(self):
+        self.pending = queue.SimpleQueue()
+        self.counter = itertools.count()
+        self.startLock = threading.Lock()
+        self.thread = None
+
+    def call(self, deadline, function, args, keyArgs):
+        if self.thread is None:
+            with self.startLock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name='TimeoutWatchdog', daemon=True)
+                    self.thread.start()
+        # [expiresAt, count, threadId, claim token, exception sent]
+        watch = [deadline.expiresAt, next(self.counter), threading.get_ident(), [True], False]
+        self.pending.put(watch)
+        try:
+            result = function(*args, **keyArgs)
+        finally:
+            try:
+                watch[3].pop()
+            except IndexError:
+                # The watchdog won: wait until it has sent the exception,
+                # then drop it if it has not been raised here yet
+                while not watch[4]:
+                    time.sleep(0)
+                _setAsyncExc(ctypes.c_ulong(watch[2]), None)
+                raise TimeoutFunctionException()
+        deadline.check()
+        return result
+
+    def _run(self):
+        watches = [] # heap of watches by deadline
+        while True:
+            timeout = max(0.0, watches[0][0] - time.monotonic()) if watches else None
+            try:
+                heapq.heappush(watches, self.pending.get(timeout=timeout))
+                continue
+            except queue.Empty:
+                pass
+            watch = heapq.heappop(watches)
+            try:
+                watch[3].pop()
+            except IndexError:
+                continue # The call already returned
+            _setAsyncExc(ctypes.c_ulong(watch[2]), ctypes.py_object(TimeoutFunctionException))
+            watch[4] = True
+
+_watchdog = _Watchdog()
 
 class TimeoutFunction:
+    """
+    Calls function, raising TimeoutFunctionException if it runs past timeout,
+    which is either a number of seconds from the start of the call or a
+    Deadline.  On the main thread the call is interrupted by an interval
+    timer (SIGALRM); in other threads by a watchdog thread.  Without either,
+    the time taken is checked when the function returns.
+    """
     def __init__(self, function, timeout):
         self.timeout = timeout
         self.function = function
@@ -623,23 +807,23 @@ class TimeoutFunction:
         raise TimeoutFunctionException()
 
     def __call__(self, *args, **keyArgs):
-        # If we have SIGALRM signal, use it to cause an exception if and
-        # when this function runs too long.  Otherwise check the time taken
-        # after the method has returned, and throw an exception then.
-        if hasattr(signal, 'SIGALRM'):
+        deadline = self.timeout
+        if not isinstance(deadline, Deadline):
+            deadline = Deadline(deadline)
+        deadline.check()
+        if hasattr(signal, 'setitimer') and threading.current_thread() is threading.main_thread():
             old = signal.signal(signal.SIGALRM, self.handle_timeout)
-            signal.alarm(self.timeout)
+            signal.setitimer(signal.ITIMER_REAL, max(deadline.remaining(), 1e-6))
             try:
                 result = self.function(*args, **keyArgs)
             finally:
+                signal.setitimer(signal.ITIMER_REAL, 0)
                 signal.signal(signal.SIGALRM, old)
-            signal.alarm(0)
+        elif _setAsyncExc is not None:
+            result = _watchdog.call(deadline, self.function, args, keyArgs)
         else:
-            startTime = time.time()
             result = self.function(*args, **keyArgs)
-            timeElapsed = time.time() - startTime
-            if timeElapsed >= self.timeout:
-                self.handle_timeout(None, None)
+            deadline.check()
         return result
 
 